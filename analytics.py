@@ -0,0 +1,1318 @@
+# Data loading and report computations shared by the dashboard and the batch
+# report CLI; nothing in here touches Streamlit
+import pandas as pd
+import numpy as np
+from collections import OrderedDict
+from contextlib import closing
+import hashlib
+import json
+import os
+import random
+import re
+import sqlite3
+import threading
+import time
+
+import metrics
+
+try:
+    import pyarrow as pa
+    import pyarrow.feather as feather
+except ImportError:  # the on-disk cache is skipped without pyarrow
+    pa = feather = None
+
+INVOICE_CSV = "Cleaned_Invoice_Data.csv"
+# A single extract, or a directory of monthly extracts (every *.csv inside is loaded)
+INVOICE_SOURCE = os.environ.get("INVOICE_SOURCE", INVOICE_CSV)
+INVOICE_CACHE_DIR = ".invoice_cache"
+INVOICE_MANIFEST = os.path.join(INVOICE_CACHE_DIR, "manifest.json")
+# Bump whenever the cleaning rules change so existing caches are rebuilt
+INVOICE_CACHE_VERSION = 5
+
+# Fingerprint a source file by size, mtime and (optionally) content hash
+def file_fingerprint(path, with_hash=True):
+    stat = os.stat(path)
+    fingerprint = {"version": INVOICE_CACHE_VERSION, "size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+    if with_hash:
+        digest = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                digest.update(block)
+        fingerprint["sha256"] = digest.hexdigest()
+    return fingerprint
+
+# Identify the parsed dataset: the source content plus the cleaning rules
+def data_version(fingerprint):
+    return f"v{fingerprint['version']}-{fingerprint['sha256'][:16]}"
+
+def _write_json_atomic(path, payload):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(payload, f)
+    os.replace(tmp_path, path)
+
+# Currency conventions of the billing extract; credits appear as "-" or "(...)"
+USD_FORMAT = {"symbol": "$", "thousands": ","}
+
+# Declared types for the invoice extract; columns not listed here are inferred
+INVOICE_SCHEMA = {
+    'Invoice_Total_in_USD': {"type": "money", "format": USD_FORMAT},
+    'Invoice_Labor_Total_in_USD': {"type": "money", "format": USD_FORMAT},
+    'Invoice_Expense_Total_in_USD': {"type": "money", "format": USD_FORMAT},
+    'Invoice_Balance_Due_in_USD': {"type": "money", "format": USD_FORMAT},
+    'Payments_Applied_Against_Invoice_in_USD': {"type": "money", "format": USD_FORMAT},
+    'Original Inv. Total': {"type": "money", "format": USD_FORMAT},
+    'Payments Received': {"type": "money", "format": USD_FORMAT},
+    # The first format is the extract's own; later ones only see values it rejected
+    'Invoice_Date': {"type": "date", "formats": ['%Y-%m-%d', '%m/%d/%Y']},
+    'Last payment date': {"type": "date", "formats": ['%Y-%m-%d', '%m/%d/%Y']},
+    'Invoice Date': {"type": "date", "formats": ['%m/%d/%Y', '%Y-%m-%d']},
+}
+MONEY_COLS = [col for col, spec in INVOICE_SCHEMA.items() if spec["type"] == "money"]
+DATE_COLS = [col for col, spec in INVOICE_SCHEMA.items() if spec["type"] == "date"]
+
+# Parse currency text such as "$1,234.50", "-1,234.50" or "(1,234.50)"
+def parse_money(values, fmt):
+    if pd.api.types.is_numeric_dtype(values):
+        return values.astype('float64').fillna(0), 0
+    # The symbol may sit outside the parentheses, as in "$(5.00)"
+    text = values.str.replace('[' + re.escape(fmt["symbol"]) + r'\s]', '', regex=True)
+    credit = (text.str.startswith('(') & text.str.endswith(')')).fillna(False)
+    junk = '[' + re.escape(fmt["symbol"] + fmt["thousands"]) + r'()\s]'
+    digits = text.str.replace(junk, '', regex=True)
+    # A bare dash is the accounting notation for zero
+    digits = digits.mask(digits == '-', '0')
+    # Always float: a chunk of whole-dollar amounts would otherwise come back as
+    # int64 and no longer match the schema of chunks with cents
+    amounts = pd.to_numeric(digits, errors='coerce').astype('float64')
+    failed = int((amounts.isna() & digits.notna() & (digits != '')).sum())
+    amounts = amounts.mask(credit, -amounts.abs())
+    return amounts.fillna(0), failed
+
+# Parse dates with fixed formats; each fallback format only sees the leftovers
+def parse_dates(values, formats):
+    if pd.api.types.is_datetime64_any_dtype(values):
+        return values, 0
+    parsed = pd.to_datetime(values, format=formats[0], errors='coerce')
+    for fmt in formats[1:]:
+        pending = parsed.isna() & values.notna()
+        if not pending.any():
+            break
+        parsed[pending] = pd.to_datetime(values[pending], format=fmt, errors='coerce')
+    failed = int((parsed.isna() & values.notna()).sum())
+    return parsed, failed
+
+# Approximate memory budget for one parsed chunk; bounds peak RSS on ingest
+INVOICE_CHUNK_BYTES = int(os.environ.get("INVOICE_CHUNK_BYTES", 64 * 1024 * 1024))
+# Rough ratio of parsed DataFrame size (object strings included) to raw CSV bytes
+_PARSE_EXPANSION = 8
+
+# Translate the chunk budget into a row count from the file's average row width
+def estimate_chunk_rows(path, chunk_bytes=None):
+    chunk_bytes = chunk_bytes or INVOICE_CHUNK_BYTES
+    with open(path, 'rb') as f:
+        sample = f.read(1 << 20)
+    row_bytes = max(1, len(sample) // max(1, sample.count(b'\n')))
+    return max(1000, chunk_bytes // (row_bytes * _PARSE_EXPANSION))
+
+# Read every column as text so each chunk parses to the same schema. Schema
+# columns are converted by clean_invoice_chunk; a type guessed for any other
+# column from a sample could be contradicted further into the file, or by a
+# later extract, and fail the whole load.
+def read_dtypes(path):
+    header = pd.read_csv(path, encoding='utf-8', nrows=0)
+    return {raw_col: 'object' for raw_col in header.columns}
+
+# Convert one chunk of the raw invoice CSV in place, counting unparseable values
+def clean_invoice_chunk(df, report):
+    df.columns = df.columns.str.strip()
+    for col, spec in INVOICE_SCHEMA.items():
+        if col not in df.columns:
+            continue
+        if spec["type"] == "money":
+            df[col], failed = parse_money(df[col], spec["format"])
+        else:
+            df[col], failed = parse_dates(df[col], spec["formats"])
+        report[col] = report.get(col, 0) + failed
+    return df
+
+# Read the invoice CSV as a stream of cleaned, consistently typed chunks
+def iter_invoice_chunks(path, chunk_rows=None, report=None, dtypes=None):
+    report = {} if report is None else report
+    reader = pd.read_csv(path, encoding='utf-8', dtype=dtypes or read_dtypes(path),
+                         chunksize=chunk_rows or estimate_chunk_rows(path))
+    with reader:
+        for chunk in reader:
+            yield clean_invoice_chunk(chunk, report)
+
+def _arrow_schema_for(chunk):
+    schema = pa.Schema.from_pandas(chunk, preserve_index=False)
+    # Columns that are entirely blank in the first chunk still hold text later on
+    for i, field in enumerate(schema):
+        if pa.types.is_null(field.type):
+            schema = schema.set(i, field.with_type(pa.string()))
+    return schema
+
+# Stream the cleaned CSV straight into an Arrow IPC file, one chunk at a time.
+# Each chunk is aggregated as it passes, so the file's cube never needs the
+# whole file in memory; returns that cube, or None without an Originator column.
+def ingest_invoice_csv(path, data_path, chunk_rows=None, report=None, dtypes=None):
+    writer = None
+    cubes = []
+    tmp_path = f"{data_path}.tmp"
+    try:
+        with pa.OSFile(tmp_path, 'wb') as sink:
+            for chunk in iter_invoice_chunks(path, chunk_rows, report, dtypes):
+                if writer is None:
+                    schema = _arrow_schema_for(chunk)
+                    writer = pa.ipc.new_file(sink, schema)
+                writer.write_table(pa.Table.from_pandas(chunk, schema=schema, preserve_index=False))
+                if 'Originator' in chunk.columns:
+                    columns = [col for col in DASHBOARD_COLUMNS if col in chunk.columns]
+                    cubes.append(build_invoice_cube(chunk[columns]).reset_index())
+            if writer is None:
+                raise ValueError(f"{path} contains no rows")
+            writer.close()
+        os.replace(tmp_path, data_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return merge_invoice_cubes(cubes) if cubes else None
+
+# Source CSVs: the file itself, or every *.csv in a directory of extracts
+def list_invoice_sources(source=None):
+    source = source or INVOICE_SOURCE
+    if os.path.isdir(source):
+        return sorted(os.path.join(source, name) for name in os.listdir(source)
+                      if name.lower().endswith('.csv'))
+    return [source]
+
+# Each source file gets its own typed part plus the part's aggregate cube
+def _part_paths(path):
+    key = hashlib.sha256(os.path.abspath(path).encode()).hexdigest()[:12]
+    stem = os.path.splitext(os.path.basename(path))[0]
+    base = os.path.join(INVOICE_CACHE_DIR, "parts", f"{stem}-{key}")
+    return f"{base}.arrow", f"{base}.cube.arrow"
+
+def _load_manifest():
+    try:
+        with open(INVOICE_MANIFEST) as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        manifest = {}
+    if manifest.get("version") != INVOICE_CACHE_VERSION:
+        manifest = {"version": INVOICE_CACHE_VERSION, "files": {}}
+    return manifest
+
+# Check a manifest entry against the file on disk; a touched but unmodified
+# file is recognised by its content hash. Returns the (possibly refreshed) entry.
+def _fresh_entry(path, entry):
+    if entry is None or not os.path.exists(entry["data"]) or not os.path.exists(entry["cube"]):
+        return None
+    current = file_fingerprint(path, with_hash=False)
+    if (current["size"], current["mtime_ns"]) == (entry["size"], entry["mtime_ns"]):
+        return entry
+    if current["size"] != entry["size"] or file_fingerprint(path)["sha256"] != entry["sha256"]:
+        return None
+    return dict(entry, mtime_ns=current["mtime_ns"])
+
+def _remove_part(entry):
+    for part_path in (entry["data"], entry["cube"]):
+        if os.path.exists(part_path):
+            os.remove(part_path)
+
+# Parse one source file into its Arrow part and aggregate that part into its own cube
+@metrics.timed()
+def _ingest_part(path, chunk_rows=None):
+    # Fingerprint before parsing so an edit mid-parse invalidates the part
+    fingerprint = file_fingerprint(path)
+    dtypes = read_dtypes(path)
+    data_path, cube_path = _part_paths(path)
+    os.makedirs(os.path.dirname(data_path), exist_ok=True)
+    report = {}
+    cube = ingest_invoice_csv(path, data_path, chunk_rows, report, dtypes)
+    if cube is not None:
+        feather.write_feather(cube.reset_index(), cube_path, compression='uncompressed')
+    else:
+        # Nothing to aggregate, but an empty cube keeps the manifest entry valid
+        feather.write_feather(pd.DataFrame({'Originator': pd.Series(dtype=object)}), cube_path)
+    return dict(fingerprint, data=data_path, cube=cube_path, parse_report=report)
+
+# Held while the cache is refreshed: the background refresher and a request can
+# both find the same file stale, and must not write the same part at once
+_CACHE_LOCK = threading.Lock()
+
+# Bring the cache up to date with the source without loading it: only new or
+# changed files are parsed, and parts of files no longer in the source are dropped
+@metrics.timed()
+def refresh_invoice_cache(source=None, chunk_rows=None):
+    with _CACHE_LOCK:
+        return _refresh_invoice_cache(source, chunk_rows)
+
+def _refresh_invoice_cache(source, chunk_rows):
+    manifest = _load_manifest()
+    before = json.dumps(manifest, sort_keys=True)
+    previous = manifest["files"]
+    entries = {}
+    for path in list_invoice_sources(source):
+        key = os.path.abspath(path)
+        entry = _fresh_entry(path, previous.get(key))
+        metrics.cache_lookup('invoice_parts', miss=entry is None)
+        entries[key] = entry if entry is not None else _ingest_part(path, chunk_rows)
+    for key, entry in previous.items():
+        if key not in entries:
+            _remove_part(entry)
+    manifest["files"] = entries
+    if json.dumps(manifest, sort_keys=True) != before:
+        _write_json_atomic(INVOICE_MANIFEST, manifest)
+    return list(entries.values())
+
+# Version and parse report of the dataset made up of the given parts
+def parts_data_version(entries):
+    digest = hashlib.sha256()
+    for entry in entries:
+        digest.update(entry["sha256"].encode())
+    return data_version({"version": INVOICE_CACHE_VERSION, "sha256": digest.hexdigest()})
+
+def parts_parse_report(entries):
+    report = {}
+    for entry in entries:
+        for col, failed in entry.get("parse_report", {}).items():
+            report[col] = report.get(col, 0) + failed
+    return report
+
+# Memory-map the part files; only the requested columns are ever paged in
+@metrics.timed()
+def _read_parts(data_paths, columns=None):
+    tables = []
+    for data_path in data_paths:
+        table = feather.read_table(data_path, memory_map=True)
+        if columns is not None:
+            table = table.select([col for col in columns if col in table.column_names])
+        tables.append(table)
+    if len(tables) == 1:
+        return tables[0].to_pandas(split_blocks=True)
+    # Extracts that lack a column get nulls for it
+    table = pa.concat_tables(tables, promote_options='default')
+    return table.to_pandas(split_blocks=True)
+
+# Sum flat (reset-index) cubes built over separate slices of the data
+def merge_invoice_cubes(parts):
+    cube = pd.concat(parts, ignore_index=True)
+    money_cols = [col for col in MONEY_COLS if col in cube.columns]
+    # Add in whole cents so the result matches a cube built over all rows at once
+    cube[money_cols] = np.round(cube[money_cols].fillna(0) * 100).astype('int64')
+    cube = cube.groupby(['Originator', 'Invoice_Month'], dropna=False, sort=True)[money_cols + ['Invoice_Count']].sum()
+    cube[money_cols] = cube[money_cols] / 100
+    return cube
+
+# Combine the per-file cubes; only the parts of new or changed files were rebuilt
+@metrics.timed()
+def combine_part_cubes(entries):
+    parts = [feather.read_table(entry["cube"]).to_pandas() for entry in entries]
+    parts = [part for part in parts if len(part)]
+    if not parts:
+        return None
+    cube = merge_invoice_cubes(parts)
+    cube.attrs['data_version'] = parts_data_version(entries)
+    return cube
+
+# Aggregate cube for the current source, refreshed incrementally
+def load_invoice_cube(source=None):
+    if pa is None:
+        return None
+    return combine_part_cubes(refresh_invoice_cache(source))
+
+# Version of the invoice data as it is on disk right now. With pyarrow this also
+# brings the Arrow cache up to date, so a rebuild afterwards only reads parts.
+def current_invoice_version(source=None):
+    if pa is not None:
+        return parts_data_version(refresh_invoice_cache(source))
+    digest = hashlib.sha256()
+    for path in list_invoice_sources(source):
+        digest.update(file_fingerprint(path)["sha256"].encode())
+    return data_version({"version": INVOICE_CACHE_VERSION, "sha256": digest.hexdigest()})
+
+# Parse every source in memory; used when pyarrow is unavailable
+def _parse_invoice_sources(source=None, chunk_rows=None, columns=None):
+    frames, report, digest = [], {}, hashlib.sha256()
+    for path in list_invoice_sources(source):
+        digest.update(file_fingerprint(path)["sha256"].encode())
+        chunks = iter_invoice_chunks(path, chunk_rows, report)
+        if columns is not None:
+            chunks = (chunk[[col for col in columns if col in chunk.columns]] for chunk in chunks)
+        frames.extend(chunks)
+    df = pd.concat(frames, ignore_index=True)
+    df.attrs['parse_report'] = report
+    df.attrs['data_version'] = data_version({"version": INVOICE_CACHE_VERSION, "sha256": digest.hexdigest()})
+    return df
+
+# Read invoice data (all columns unless a subset is requested); errors propagate
+@metrics.timed()
+def read_invoice_data(columns=None, source=None):
+    if pa is None:
+        return _parse_invoice_sources(source, columns=columns)
+    entries = refresh_invoice_cache(source)
+    data_paths = [entry["data"] for entry in entries]
+    df = _read_parts(data_paths, columns)
+    df.attrs['parse_report'] = parts_parse_report(entries)
+    df.attrs['data_version'] = parts_data_version(entries)
+    # The parts behind this frame, so full rows can be streamed from them later
+    df.attrs['data_paths'] = data_paths
+    return df
+
+# Columns the dashboard views read; everything else stays on disk
+DASHBOARD_COLUMNS = ['Originator', 'Invoice_Date', 'Last payment date', 'Invoice Date'] + MONEY_COLS
+# Text columns with fewer distinct values than this share of rows become categoricals
+_CATEGORY_MAX_RATIO = 0.5
+
+# Whether compaction stored a money column as integer cents. Recorded in the
+# frame's attrs rather than read off the dtype, since integer dollars are not cents.
+def is_cents(df, col):
+    return col in df.attrs.get('cents_columns', ())
+
+# Money columns stored as integer cents are decoded back to dollars on read
+def money_values(df, col):
+    values = df[col]
+    if is_cents(df, col):
+        return values / 100
+    return values
+
+# Shrink the dashboard frame: categorical text and fixed-point money in cents
+@metrics.timed()
+def compact_invoice_frame(df):
+    before = int(df.memory_usage(deep=True).sum())
+    compact = pd.DataFrame(index=df.index)
+    cents_columns = list(df.attrs.get('cents_columns', ()))
+    for col in df.columns:
+        values = df[col]
+        if (col in MONEY_COLS and col not in cents_columns and pd.api.types.is_numeric_dtype(values)
+                and not pd.api.types.is_bool_dtype(values)):
+            # Blank amounts count as zero, as parse_money treats them
+            cents = np.round(values.astype('float64').fillna(0).to_numpy() * 100)
+            fits_int32 = len(cents) == 0 or np.abs(cents).max() < np.iinfo(np.int32).max
+            values = pd.Series(cents.astype(np.int32 if fits_int32 else np.int64), index=df.index)
+            cents_columns.append(col)
+        elif values.dtype == object and values.nunique() < _CATEGORY_MAX_RATIO * len(values):
+            values = values.astype('category')
+        compact[col] = values
+    compact.attrs = dict(df.attrs, cents_columns=cents_columns,
+                         compaction={'before_bytes': before,
+                                     'after_bytes': int(compact.memory_usage(deep=True).sum())})
+    return compact
+
+# Materialise money totals by Originator and invoice month, once per data version
+@metrics.timed()
+def build_invoice_cube(df):
+    money_cols = [col for col in MONEY_COLS if col in df.columns]
+    if 'Invoice_Date' in df.columns:
+        month = df['Invoice_Date'].dt.to_period('M').dt.to_timestamp()
+    else:
+        month = pd.Series(pd.NaT, index=df.index)
+    grouped = df.groupby([df['Originator'].rename('Originator'), month.rename('Invoice_Month')],
+                         dropna=False, sort=True, observed=True)
+    cube = grouped[money_cols].sum()
+    # Rows without an Originator cannot be attributed to anyone
+    cube = cube[cube.index.get_level_values('Originator').notna()].sort_index()
+    for col in money_cols:
+        # Sums of cents are exact; convert to dollars only once they are small
+        if is_cents(df, col):
+            cube[col] = cube[col] / 100
+    cube['Invoice_Count'] = grouped.size()
+    return cube
+
+# Sum one cube metric per Originator, optionally limited to a month range
+def cube_originator_totals(cube, metric, start=None, end=None):
+    if metric not in cube.columns:
+        return pd.Series(dtype='float64', name=metric)
+    values = cube[metric]
+    if start is not None or end is not None:
+        months = values.index.get_level_values('Invoice_Month')
+        in_range = months.notna()
+        if start is not None:
+            in_range &= months >= pd.Timestamp(start).to_period('M').to_timestamp()
+        if end is not None:
+            in_range &= months <= pd.Timestamp(end)
+        values = values[in_range]
+    if metric == 'Invoice_Count':
+        return values.groupby(level='Originator', observed=True).sum()
+    # Re-add in whole cents so the totals do not depend on summation order
+    cents = np.round(values * 100).astype('int64')
+    return cents.groupby(level='Originator', observed=True).sum() / 100
+
+# Common given-name variants; the first entry of each group is the canonical form
+NICKNAME_GROUPS = [
+    ('edward', 'ed', 'eddie', 'edwin', 'edmund', 'ted'),
+    ('robert', 'rob', 'bob', 'bobby', 'bert'),
+    ('william', 'will', 'bill', 'billy', 'liam'),
+    ('james', 'jim', 'jimmy', 'jamie'),
+    ('john', 'jack', 'johnny'),
+    ('jeffrey', 'jeff', 'geoffrey'),
+    ('matthew', 'matt'),
+    ('steven', 'steve', 'stephen'),
+    ('samuel', 'sam', 'sammy'),
+    ('david', 'dave'),
+    ('deborah', 'debbie', 'deb', 'debra'),
+    ('timothy', 'tim'),
+    ('patrick', 'pat'),
+    ('jacob', 'jake'),
+    ('charles', 'chip', 'chuck', 'charlie'),
+    ('daniel', 'dan', 'danny'),
+    ('michael', 'mike'),
+    ('thomas', 'tom', 'tommy'),
+    ('richard', 'rick', 'rich', 'dick'),
+    ('joseph', 'joe'),
+    ('christopher', 'chris'),
+    ('elizabeth', 'liz', 'beth', 'betsy'),
+    ('katherine', 'kate', 'kathy', 'catherine'),
+    ('jennifer', 'jen', 'jenny'),
+    ('alexander', 'alex'),
+    ('andrew', 'andy', 'drew'),
+    ('benjamin', 'ben'),
+    ('anthony', 'tony'),
+    ('nicholas', 'nick'),
+    ('jonathan', 'jon'),
+    ('kenneth', 'ken'),
+    ('ronald', 'ron'),
+    ('gregory', 'greg'),
+    ('peter', 'pete'),
+    ('susan', 'sue'),
+    ('margaret', 'maggie', 'peggy'),
+]
+_CANONICAL_GIVEN_NAMES = {name: group[0] for group in NICKNAME_GROUPS for name in group}
+_NAME_SUFFIXES = {'jr', 'sr', 'ii', 'iii', 'iv', 'esq'}
+
+# Normalised lookup keys for a person's name, most specific first
+def name_keys(name):
+    if not isinstance(name, str):
+        return []
+    if ',' in name:
+        # "Last, First Middle" -> "First Middle Last"
+        last, _, first = name.partition(',')
+        name = f"{first} {last}"
+    tokens = re.findall(r"[a-z]+", name.lower().replace("'", ""))
+    # Initials and suffixes carry no identity once the surname is known
+    tokens = [token for token in tokens if len(token) > 1 and token not in _NAME_SUFFIXES]
+    if len(tokens) < 2:
+        return [' '.join(tokens)] if tokens else []
+    surname = tokens[-1]
+    keys = [' '.join(tokens)]
+    keys += [f"{_CANONICAL_GIVEN_NAMES.get(given, given)} {surname}" for given in tokens[:-1]]
+    return list(dict.fromkeys(keys))
+
+# Map name keys to Originator codes. Codes that normalise to the same full name
+# are one person billed under several spellings; keys shared by different
+# people are ambiguous and dropped.
+def build_originator_index(originators):
+    index = pd.DataFrame({'Originator': pd.Series(originators, dtype=object).dropna().unique()})
+    index['key'] = index['Originator'].map(name_keys)
+    index['person'] = index['key'].str[0]
+    index = index.explode('key').dropna(subset=['key'])
+    people_per_key = index.groupby('key')['person'].transform('nunique')
+    return index.loc[people_per_key == 1, ['key', 'Originator']].reset_index(drop=True)
+
+# Pair every personnel row with its Originator codes in one join; the most
+# specific matching key wins and unmatched people are dropped
+def attach_originators(personnel_df, originator_index):
+    people = personnel_df.reset_index(drop=True)
+    keys = people['name'].map(name_keys).explode().dropna().rename('key').to_frame()
+    keys['rank'] = keys.groupby(level=0).cumcount()
+    keys = keys.rename_axis('person_row').reset_index()
+    matches = keys.merge(originator_index, on='key', how='inner')
+    matches = matches[matches['rank'] == matches.groupby('person_row')['rank'].transform('min')]
+    matches = matches.drop_duplicates(['person_row', 'Originator'])
+    return people.join(matches.set_index('person_row')['Originator'], how='inner')
+
+# Total each matched person's billing across all of their Originator codes
+@metrics.timed()
+def personnel_impact(personnel_df, originator_totals, originator_index):
+    matched = attach_originators(personnel_df, originator_index)
+    matched = matched.merge(originator_totals.rename('Total_Billed'),
+                            left_on='Originator', right_index=True, how='inner')
+    people_cols = list(personnel_df.columns)
+    return matched.groupby(matched.index, sort=False).agg(
+        {**{col: 'first' for col in people_cols},
+         'Originator': lambda codes: ' / '.join(codes), 'Total_Billed': 'sum'})
+
+# Billing windows (in days) either side of a personnel change
+BILLING_WINDOWS = (90, 180, 365)
+_DAY_OFFSET = 1 << 31
+
+def money_cents(df, col):
+    values = df[col]
+    if is_cents(df, col):
+        return values.to_numpy(dtype='int64')
+    return np.round(values.to_numpy(dtype='float64') * 100).astype('int64')
+
+def _days(dates):
+    return np.asarray(dates, dtype='datetime64[ns]').astype('datetime64[D]').astype('int64')
+
+# One sortable int64 per (Originator code, day): all of an Originator's invoices
+# are contiguous and in date order once sorted
+def _timeline_keys(codes, days):
+    return codes.astype('int64') * (1 << 32) + (days + _DAY_OFFSET)
+
+# Invoices sorted by Originator then date, with running totals in cents, so any
+# date window for any Originator is two binary searches and a subtraction
+@metrics.timed()
+def build_billing_timeline(df, metric='Invoice_Total_in_USD'):
+    valid = (df['Originator'].notna() & df['Invoice_Date'].notna()).to_numpy()
+    codes, originators = pd.factorize(df['Originator'][valid])
+    keys = _timeline_keys(codes, _days(df['Invoice_Date'][valid]))
+    order = np.argsort(keys, kind='stable')
+    cumulative = np.concatenate([[0], np.cumsum(money_cents(df, metric)[valid][order])])
+    return {'keys': keys[order], 'cumulative': cumulative,
+            'originators': pd.Index(np.asarray(originators, dtype=object))}
+
+# Billing before [date - w, date) and after [date, date + w) for every
+# (person, Originator) pair at once, via sorted as-of lookups on the timeline
+def timeline_billing_windows(timeline, matched, windows=BILLING_WINDOWS):
+    codes = timeline['originators'].get_indexer(matched['Originator'])
+    found = codes >= 0
+    codes = np.where(found, codes, 0)
+    days = _days(matched['date'])
+    keys, cumulative = timeline['keys'], timeline['cumulative']
+    at_change = cumulative[np.searchsorted(keys, _timeline_keys(codes, days))]
+    result = pd.DataFrame(index=matched.index)
+    for window in windows:
+        start = cumulative[np.searchsorted(keys, _timeline_keys(codes, days - window))]
+        end = cumulative[np.searchsorted(keys, _timeline_keys(codes, days + window))]
+        result[f'Before_{window}d'] = np.where(found, at_change - start, 0) / 100
+        result[f'After_{window}d'] = np.where(found, end - at_change, 0) / 100
+    return result
+
+# Per-person billing around each joiner's and leaver's date, summed over all of
+# the person's Originator codes
+@metrics.timed()
+def personnel_billing_windows(engine, personnel_df, originator_index, windows=BILLING_WINDOWS):
+    matched = attach_originators(personnel_df, originator_index)
+    windowed = engine.billing_windows(matched[['Originator', 'date']], windows).groupby(level=0).sum()
+    people = personnel_df.reset_index(drop=True).loc[windowed.index]
+    return people.join(windowed)
+
+# All columns of the parts as one dataset; extracts that lack a column get nulls
+def parts_dataset(data_paths):
+    import pyarrow.dataset as ds
+    import pyarrow.fs as fs
+
+    schema = pa.unify_schemas([feather.read_table(path, memory_map=True).schema for path in data_paths])
+    # Memory-mapped, so scanning a batch only pages in that batch
+    return ds.dataset(data_paths, schema=schema, format='ipc', filesystem=fs.LocalFileSystem(use_mmap=True))
+
+# Stream a parts dataset batch by batch; rows are sorted positions across all
+# parts, as held by a filtered view, or None for every row
+def iter_dataset_chunks(dataset, chunk_rows, rows=None):
+    offset = 0
+    empty = True
+    for batch in dataset.to_batches(batch_size=chunk_rows):
+        start, offset = offset, offset + batch.num_rows
+        if rows is not None:
+            lo, hi = np.searchsorted(rows, [start, offset])
+            if lo == hi:
+                continue
+            batch = batch.take(pa.array(rows[lo:hi] - start))
+        empty = False
+        yield batch.to_pandas()
+    if empty:
+        # Writers still need the columns for a header
+        yield dataset.schema.empty_table().to_pandas()
+
+# Query engine for invoice aggregates: "pandas" (in memory) or "duckdb" (out of core)
+INVOICE_BACKEND = os.environ.get("INVOICE_BACKEND", "pandas")
+
+# Default engine: aggregates come from the cube over the in-memory frame
+class PandasInvoiceEngine:
+    name = 'pandas'
+
+    def __init__(self, df, cube=None):
+        self.df = df
+        self.version = df.attrs.get('data_version')
+        self.row_count = len(df)
+        # Billing windows need invoice dates; some extracts have none
+        self.has_dates = 'Invoice_Date' in df.columns
+        # Reuse the incrementally maintained cube when it describes this very frame
+        if cube is None or cube.attrs.get('data_version') != self.version:
+            cube = build_invoice_cube(df) if 'Originator' in df.columns else None
+        self.cube = cube
+        self.memory_bytes = int(df.memory_usage(deep=True).sum())
+        self._data_paths = df.attrs.get('data_paths') if pa is not None else None
+        self._timeline = None
+        self._timeline_lock = threading.Lock()
+
+    def originator_totals(self, metric, start=None, end=None):
+        if self.cube is None:
+            return pd.Series(dtype='float64', name=metric)
+        return cube_originator_totals(self.cube, metric, start, end)
+
+    def top_originators(self, metric, n, start=None, end=None):
+        return self.originator_totals(metric, start, end).nlargest(n)
+
+    def billing_windows(self, matched, windows=BILLING_WINDOWS):
+        # Built on first use, then shared by every session for this data version
+        with self._timeline_lock:
+            metrics.cache_lookup('billing_timeline', miss=self._timeline is None)
+            if self._timeline is None:
+                self._timeline = build_billing_timeline(self.df)
+        return timeline_billing_windows(self._timeline, matched, windows)
+
+    # All columns, streamed from the very parts this frame was read from, so a
+    # refresh of the cache in the meantime cannot shift the rows; rows are
+    # positions from a filtered view
+    def iter_chunks(self, chunk_rows=None, rows=None):
+        chunk_rows = chunk_rows or EXPORT_CHUNK_ROWS
+        if self._data_paths:
+            dataset = parts_dataset(self._data_paths)
+            # A frame derived from the parts (e.g. a filtered one) no longer lines up with them
+            if dataset.count_rows() == self.row_count:
+                return iter_dataset_chunks(dataset, chunk_rows, rows)
+        # Without the parts only the in-memory columns can be exported
+        df = self.df if rows is None else self.df.take(rows)
+        df = df.assign(**{col: money_values(df, col) for col in MONEY_COLS if col in df.columns})
+        return iter_frame_chunks(df, chunk_rows)
+
+# Aggregates over some rows of a shared frame, for a filtered view. Only the
+# columns they read are gathered at those rows, and only the resulting cube and
+# billing timeline are kept, never a copy of the rows themselves.
+class SubsetInvoiceEngine(PandasInvoiceEngine):
+    def __init__(self, df, rows, metric='Invoice_Total_in_USD'):
+        columns = [col for col in ('Originator', 'Invoice_Date', metric) if col in df.columns]
+        subset = pd.DataFrame({col: df[col].take(rows) for col in columns})
+        subset.attrs['cents_columns'] = [col for col in columns if is_cents(df, col)]
+        super().__init__(subset)
+        if self.has_dates and 'Originator' in columns and metric in columns:
+            self._timeline = build_billing_timeline(subset, metric)
+        self.df = subset.iloc[:0]
+        self.memory_bytes = 0 if self.cube is None else int(self.cube.memory_usage(deep=True).sum())
+        if self._timeline is not None:
+            self.memory_bytes += (self._timeline['keys'].nbytes + self._timeline['cumulative'].nbytes
+                                  + int(self._timeline['originators'].memory_usage(deep=True)))
+
+# DuckDB over the Arrow cache: aggregates are pushed down as SQL and the invoice
+# rows are scanned from disk, never materialised as a DataFrame
+class DuckDBInvoiceEngine:
+    name = 'duckdb'
+
+    def __init__(self, source=None):
+        # Imported here so the pandas backend never pays for loading duckdb
+        import duckdb
+
+        entries = refresh_invoice_cache(source)
+        self.version = parts_data_version(entries)
+        self.parse_report = parts_parse_report(entries)
+        self.df = pd.DataFrame()
+        self.memory_bytes = 0
+        self._dataset = parts_dataset([entry["data"] for entry in entries])
+        self._columns = set(self._dataset.schema.names)
+        self.has_dates = 'Invoice_Date' in self._columns
+        self._con = duckdb.connect()
+        self._con.register('invoices', self._dataset)
+        self._lock = threading.Lock()
+        self.row_count = int(self._query("SELECT COUNT(*) AS n FROM invoices")['n'].iloc[0])
+        self.cube = combine_part_cubes(entries) if 'Originator' in self._columns else None
+
+    def _query(self, sql, params=None):
+        # One connection is shared by every session, so queries take turns
+        with self._lock:
+            return self._con.execute(sql, params or []).df()
+
+    # Sum in integer cents, exactly as the pandas cube does, so both engines agree
+    @staticmethod
+    def _sum_dollars(col):
+        return f'SUM(CAST(ROUND("{col}" * 100) AS BIGINT)) / 100.0'
+
+    def _month_filter(self, start, end):
+        clauses, params = ['Originator IS NOT NULL'], []
+        if start is not None:
+            clauses.append("date_trunc('month', Invoice_Date) >= ?")
+            params.append(pd.Timestamp(start).to_period('M').to_timestamp().to_pydatetime())
+        if end is not None:
+            clauses.append("date_trunc('month', Invoice_Date) <= ?")
+            params.append(pd.Timestamp(end).to_pydatetime())
+        return ' AND '.join(clauses), params
+
+    def originator_totals(self, metric, start=None, end=None):
+        if metric not in self._columns:
+            return pd.Series(dtype='float64', name=metric)
+        where, params = self._month_filter(start, end)
+        totals = self._query(f'SELECT Originator, {self._sum_dollars(metric)} AS total FROM invoices '
+                             f'WHERE {where} GROUP BY Originator ORDER BY Originator', params)
+        return totals.set_index('Originator')['total'].rename(metric)
+
+    def top_originators(self, metric, n, start=None, end=None):
+        if metric not in self._columns:
+            return pd.Series(dtype='float64', name=metric)
+        where, params = self._month_filter(start, end)
+        totals = self._query(f'SELECT Originator, {self._sum_dollars(metric)} AS total FROM invoices '
+                             f'WHERE {where} GROUP BY Originator '
+                             f'ORDER BY total DESC, Originator LIMIT ?', params + [n])
+        return totals.set_index('Originator')['total'].rename(metric)
+
+    # The same windows as a single range join pushed down to DuckDB
+    def billing_windows(self, matched, windows=BILLING_WINDOWS):
+        people = pd.DataFrame({'row_id': np.arange(len(matched)), 'Originator': matched['Originator'].astype(str),
+                               'change_date': matched['date'].dt.date})
+        cents = 'CAST(ROUND(i."Invoice_Total_in_USD" * 100) AS BIGINT)'
+        invoice_day = 'CAST(i.Invoice_Date AS DATE)'
+        sums = []
+        for window in windows:
+            sums.append(f"COALESCE(SUM(CASE WHEN {invoice_day} >= p.change_date - {window} "
+                        f"AND {invoice_day} < p.change_date THEN {cents} END), 0) / 100.0 AS Before_{window}d")
+            sums.append(f"COALESCE(SUM(CASE WHEN {invoice_day} >= p.change_date "
+                        f"AND {invoice_day} < p.change_date + {window} THEN {cents} END), 0) / 100.0 AS After_{window}d")
+        widest = max(windows)
+        with self._lock:
+            self._con.register('people', people)
+            try:
+                result = self._con.execute(
+                    f"SELECT p.row_id, {', '.join(sums)} FROM people p "
+                    f"LEFT JOIN invoices i ON i.Originator = p.Originator "
+                    f"AND {invoice_day} >= p.change_date - {widest} AND {invoice_day} < p.change_date + {widest} "
+                    f"GROUP BY p.row_id").df()
+            finally:
+                self._con.unregister('people')
+        result = result.set_index('row_id').reindex(np.arange(len(matched))).fillna(0)
+        return result.set_axis(matched.index)
+
+    def iter_chunks(self, chunk_rows=None, rows=None):
+        return iter_dataset_chunks(self._dataset, chunk_rows or EXPORT_CHUNK_ROWS, rows)
+
+# Keeps one expensive value warm for the whole process. After the first load,
+# reads never wait: once the value is older than its TTL (jittered, so processes
+# started together do not all reload at once) a background thread checks the
+# version and rebuilds only if it changed, while callers keep the current value.
+class StaleWhileRevalidate:
+    def __init__(self, build, ttl, version=None, jitter=0.1, name='refresh', fallback=None, retry=30):
+        self._build = build
+        self._version = version
+        # Called with the error when the very first load fails, so readers
+        # always get a value; it is replaced as soon as a load succeeds
+        self._fallback = fallback
+        self._ttl = ttl
+        self._retry = retry
+        self._jitter = jitter
+        self._name = name
+        self._value = None
+        self._value_version = None
+        self._expires = 0.0
+        self._refreshing = False
+        self._lock = threading.Lock()
+        self._loaded = threading.Event()
+        self.last_error = None
+        self.refreshes = 0
+
+    @property
+    def ready(self):
+        return self._loaded.is_set()
+
+    # Begin loading in the background, e.g. at startup before any reader arrives
+    def start(self):
+        self._refresh_async()
+        return self
+
+    def _refresh_async(self):
+        with self._lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+        threading.Thread(target=self._refresh, name=self._name, daemon=True).start()
+
+    def _refresh(self):
+        delay = self._ttl
+        try:
+            version = self._version() if self._version is not None else None
+            if not self.ready or version is None or version != self._value_version:
+                value = self._build()
+                with self._lock:
+                    self._value, self._value_version = value, version
+                    self.refreshes += 1
+            self.last_error = None
+        except Exception as e:
+            # Keep serving the last good value and retry soon rather than a TTL later
+            self.last_error = e
+            delay = self._retry
+            if not self.refreshes and self._fallback is not None:
+                with self._lock:
+                    self._value = self._fallback(e)
+        finally:
+            with self._lock:
+                self._expires = time.monotonic() + delay * (1 + random.uniform(-self._jitter, self._jitter))
+                self._refreshing = False
+            self._loaded.set()
+
+    # The current value; only the very first load is waited for
+    def get(self, timeout=None):
+        if not self.ready:
+            self._refresh_async()
+            self._loaded.wait(timeout)
+        elif time.monotonic() >= self._expires:
+            self._refresh_async()
+        return self._value
+
+# Process-wide invoice engine plus everything derived from it, built once per
+# data version. Sessions read it through views and must never mutate it.
+class SharedInvoiceData:
+    def __init__(self, engine):
+        self.engine = engine
+        self.df = engine.df
+        self.version = engine.version
+        self.row_count = engine.row_count
+        self.cube = engine.cube
+        self.originator_index = None
+        # (level, message) pairs from loading, for the page to show
+        self.load_messages = []
+        self._filter_index = None
+        self._filter_lock = threading.Lock()
+        self.shared_bytes = engine.memory_bytes
+        if self.cube is not None:
+            self.originator_index = build_originator_index(self.cube.index.get_level_values('Originator'))
+            self.shared_bytes += int(self.cube.memory_usage(deep=True).sum())
+
+    def view(self, rows=None, key=None):
+        return InvoiceView(self, rows, key)
+
+    # Built on first use (the background refresh calls it before swapping the
+    # dataset in, so requests normally find it ready)
+    @property
+    def filter_index(self):
+        with self._filter_lock:
+            if self._filter_index is None and 'Invoice_Date' in self.df.columns and len(self.df):
+                self._filter_index = InvoiceFilterIndex(self.df)
+            return self._filter_index
+
+# A session's window onto the shared dataset: optional row positions, no copy
+class InvoiceView:
+    def __init__(self, shared, rows=None, key=None):
+        self.shared = shared
+        self.rows = rows
+        # Identifies the filters behind the rows, for keying anything derived from them
+        self.key = key
+
+    @property
+    def version(self):
+        return self.shared.version if self.key is None else f"{self.shared.version}:{self.key}"
+
+    @property
+    def empty(self):
+        return not self.shared.row_count or (self.rows is not None and len(self.rows) == 0)
+
+    # Materialise the selected rows; the unfiltered view is the shared frame itself
+    def frame(self):
+        if self.rows is None:
+            return self.shared.df
+        return self.shared.df.take(self.rows)
+
+    @property
+    def allocated_bytes(self):
+        return 0 if self.rows is None else int(self.rows.nbytes)
+
+PAYMENT_STATUSES = ('Paid', 'Partially paid', 'Unpaid')
+# Filter combinations whose row positions are kept for reuse
+FILTER_CACHE_SIZE = 128
+
+# Row positions matching the sidebar filters, from structures built once per
+# data version:
+#   - invoice dates as int32 days, with positions sorted by date, so a date
+#     range is two binary searches and a slice;
+#   - Originator codes with per-code posting lists, and a bitmap over the
+#     codes to test membership;
+#   - payment status as one byte per row.
+# The narrowest of the date slice and the Originator postings becomes the
+# candidate set, and the remaining filters are checked on those rows only.
+class InvoiceFilterIndex:
+    def __init__(self, df):
+        self.row_count = len(df)
+        position_dtype = np.int32 if len(df) < np.iinfo(np.int32).max else np.int64
+        dates = df['Invoice_Date']
+        self._has_date = dates.notna().to_numpy()
+        self._days = np.where(self._has_date, _days(dates), 0).astype(np.int32)
+        self._date_order = np.argsort(np.where(self._has_date, self._days, np.iinfo(np.int32).max),
+                                      kind='stable')[:int(self._has_date.sum())].astype(position_dtype)
+        self._sorted_days = self._days[self._date_order]
+        self.date_range = ((_day_timestamp(self._sorted_days[0]), _day_timestamp(self._sorted_days[-1]))
+                           if len(self._sorted_days) else (None, None))
+
+        self.originators = pd.Index([], dtype=object)
+        self._codes = None
+        if 'Originator' in df.columns:
+            codes, uniques = pd.factorize(df['Originator'])
+            self.originators = pd.Index(np.asarray(uniques, dtype=object))
+            self._codes = codes.astype(np.int32)
+            by_code = np.argsort(self._codes, kind='stable').astype(position_dtype)
+            # Rows without an Originator have code -1 and sort first
+            self._postings = by_code[int((self._codes < 0).sum()):]
+            self._offsets = np.concatenate([[0], np.cumsum(np.bincount(self._codes[self._codes >= 0],
+                                                                       minlength=len(uniques)))])
+
+        # Balances are compared in the column's own units (cents once compacted)
+        self._balance = None
+        self.balance_range = (None, None)
+        if 'Invoice_Balance_Due_in_USD' in df.columns:
+            self._balance = df['Invoice_Balance_Due_in_USD'].to_numpy()
+            self._balance_scale = 100 if is_cents(df, 'Invoice_Balance_Due_in_USD') else 1
+            if len(self._balance):
+                self.balance_range = (self._balance.min() / self._balance_scale,
+                                      self._balance.max() / self._balance_scale)
+
+        self._status = None
+        if self._balance is not None and 'Payments_Applied_Against_Invoice_in_USD' in df.columns:
+            paid = df['Payments_Applied_Against_Invoice_in_USD'].to_numpy() > 0
+            self._status = np.where(self._balance <= 0, 0, np.where(paid, 1, 2)).astype(np.uint8)
+
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def has_balance(self):
+        return self._balance is not None
+
+    @property
+    def has_status(self):
+        return self._status is not None
+
+    @staticmethod
+    def filter_key(start=None, end=None, originators=None, balance=None, statuses=None):
+        key = (None if start is None else str(pd.Timestamp(start).date()),
+               None if end is None else str(pd.Timestamp(end).date()),
+               tuple(sorted(originators)) if originators else None,
+               tuple(balance) if balance is not None else None,
+               tuple(sorted(statuses)) if statuses else None)
+        return None if key == (None,) * 5 else key
+
+    # Sorted row positions for the filters, or None when nothing is filtered.
+    # The same combination returns the same read-only array.
+    def select(self, start=None, end=None, originators=None, balance=None, statuses=None):
+        key = self.filter_key(start, end, originators, balance, statuses)
+        if key is None:
+            return None
+        with self._lock:
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                metrics.cache_lookup('filters')
+                return self._cache[key]
+        metrics.cache_lookup('filters', miss=True)
+        rows = self._select(start, end, originators, balance, statuses)
+        rows.flags.writeable = False
+        with self._lock:
+            self._cache[key] = rows
+            while len(self._cache) > FILTER_CACHE_SIZE:
+                self._cache.popitem(last=False)
+        return rows
+
+    def _select(self, start, end, originators, balance, statuses):
+        candidates = []
+        first_day = None if start is None else _days([pd.Timestamp(start)])[0]
+        last_day = None if end is None else _days([pd.Timestamp(end)])[0]
+        if start is not None or end is not None:
+            lo = 0 if start is None else np.searchsorted(self._sorted_days, first_day, 'left')
+            hi = len(self._sorted_days) if end is None else np.searchsorted(self._sorted_days, last_day, 'right')
+            candidates.append(self._date_order[lo:hi])
+        codes = None
+        if originators and self._codes is not None:
+            codes = self.originators.get_indexer(list(originators))
+            codes = codes[codes >= 0]
+            candidates.append(np.concatenate([self._postings[self._offsets[c]:self._offsets[c + 1]]
+                                              for c in codes] or [self._postings[:0]]))
+        elif originators:
+            return np.array([], dtype=np.int64)
+        rows = min(candidates, key=len) if candidates else np.arange(self.row_count)
+
+        keep = np.ones(len(rows), dtype=bool)
+        if start is not None or end is not None:
+            days = self._days[rows]
+            keep &= self._has_date[rows]
+            if start is not None:
+                keep &= days >= first_day
+            if end is not None:
+                keep &= days <= last_day
+        if codes is not None:
+            # One bit per Originator code; the trailing False catches code -1
+            selected = np.zeros(len(self.originators) + 1, dtype=bool)
+            selected[codes] = True
+            keep &= selected[self._codes[rows]]
+        if balance is not None and self._balance is not None:
+            values = self._balance[rows]
+            low, high = (round(bound * self._balance_scale) for bound in balance)
+            keep &= (values >= low) & (values <= high)
+        if statuses and self._status is not None:
+            selected = np.isin(np.arange(len(PAYMENT_STATUSES)), [PAYMENT_STATUSES.index(s) for s in statuses])
+            keep &= selected[self._status[rows]]
+        return np.sort(rows[keep])
+
+def _day_timestamp(day):
+    return pd.Timestamp(int(day), unit='D')
+
+PERSONNEL_DB = os.environ.get("PERSONNEL_DB", "personnel.db")
+PERSONNEL_TYPES = ('Joiner', 'Leaver')
+
+# Records written into a brand-new registry; later changes are added to the store
+SEED_PERSONNEL_CHANGES = [
+    # Q4 2024 Leavers
+    {"name": "Matthew Poppe", "date": "10/16/2024", "type": "Leaver", "notes": ""},
+    {"name": "Marc Kaufman", "date": "11/13/2024", "type": "Leaver", "notes": ""},
+    {"name": "Steven Eichel", "date": "11/19/2024", "type": "Leaver", "notes": ""},
+    {"name": "Chelsea Ellis", "date": "11/19/2024", "type": "Leaver", "notes": "Did not originate"},
+    {"name": "Sam Finkelstein", "date": "11/19/2024", "type": "Leaver", "notes": "Did not originate"},
+    {"name": "T. James Min", "date": "11/19/2024", "type": "Leaver", "notes": ""},
+    {"name": "Jeffrey Fromm", "date": "11/21/2024", "type": "Leaver", "notes": ""},
+    {"name": "David Mahoney", "date": "11/21/2024", "type": "Leaver", "notes": ""},
+    {"name": "J Paul Gignac", "date": "12/2/2024", "type": "Leaver", "notes": ""},
+    {"name": "Deborah Turofsky", "date": "12/5/2024", "type": "Leaver", "notes": "Did not originate"},
+    {"name": "David Mittelman", "date": "12/18/2024", "type": "Leaver", "notes": ""},
+    {"name": "Dale Rieger", "date": "12/20/2024", "type": "Leaver", "notes": ""},
+    # Q1 2025 Leavers
+    {"name": "Dror Futter", "date": "2/28/2025", "type": "Leaver", "notes": ""},
+    {"name": "Leo Liu", "date": "3/1/2025", "type": "Leaver", "notes": ""},
+    # Q4 2024 Joiners
+    {"name": "Tim Kennedy", "date": "10/7/2024", "type": "Joiner", "notes": "PCT Team Associate"},
+    {"name": "Patrick McCormick", "date": "10/15/2024", "type": "Joiner", "notes": ""},
+    {"name": "Jake Mendoza", "date": "11/18/2024", "type": "Joiner", "notes": "PCT Team Partner"},
+    {"name": "Sarah Challen McKee", "date": "11/18/2024", "type": "Joiner", "notes": "PCT Team Associate"},
+    {"name": "Ruben Salcido Monreal", "date": "11/18/2024", "type": "Joiner", "notes": "Associate"},
+    {"name": "Robert Pepple", "date": "12/2/2024", "type": "Joiner", "notes": ""},
+    {"name": "Sydney Blomstrom", "date": "12/2/2024", "type": "Joiner", "notes": "Associate"},
+    {"name": "Edwin Barkel", "date": "12/16/2024", "type": "Joiner", "notes": "BOB shared with Hilary Wells"},
+    {"name": "Hilary Wells", "date": "12/16/2024", "type": "Joiner", "notes": "BOB shared with Ed Barkel"},
+    # Q1 2025 Joiners
+    {"name": "Ivan Moskowitz", "date": "1/6/2025", "type": "Joiner", "notes": ""},
+    {"name": "Chip Fisher", "date": "2/3/2025", "type": "Joiner", "notes": "PCT Team Counsel"},
+    {"name": "Lisel Ferguson", "date": "2/24/2025", "type": "Joiner", "notes": ""},
+    {"name": "Hua Howard Wang", "date": "3/12/2025", "type": "Joiner", "notes": ""},
+]
+
+_PERSONNEL_SCHEMA = """
+CREATE TABLE IF NOT EXISTS personnel_changes (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL,
+    date TEXT NOT NULL,
+    quarter TEXT NOT NULL,
+    type TEXT NOT NULL CHECK (type IN ('Joiner', 'Leaver')),
+    notes TEXT NOT NULL DEFAULT ''
+);
+CREATE INDEX IF NOT EXISTS idx_personnel_date ON personnel_changes (date);
+CREATE INDEX IF NOT EXISTS idx_personnel_quarter ON personnel_changes (quarter, date);
+CREATE INDEX IF NOT EXISTS idx_personnel_type ON personnel_changes (type, date);
+CREATE TABLE IF NOT EXISTS registry_meta (key TEXT PRIMARY KEY, value INTEGER NOT NULL);
+INSERT OR IGNORE INTO registry_meta (key, value) VALUES ('revision', 0);
+CREATE TRIGGER IF NOT EXISTS personnel_insert AFTER INSERT ON personnel_changes
+BEGIN UPDATE registry_meta SET value = value + 1 WHERE key = 'revision'; END;
+CREATE TRIGGER IF NOT EXISTS personnel_update AFTER UPDATE ON personnel_changes
+BEGIN UPDATE registry_meta SET value = value + 1 WHERE key = 'revision'; END;
+CREATE TRIGGER IF NOT EXISTS personnel_delete AFTER DELETE ON personnel_changes
+BEGIN UPDATE registry_meta SET value = value + 1 WHERE key = 'revision'; END;
+"""
+
+def quarter_label(date):
+    return f"Q{date.quarter} {date.year}"
+
+def _personnel_row(name, date, change_type, notes=''):
+    if change_type not in PERSONNEL_TYPES:
+        raise ValueError(f"Unknown change type: {change_type}")
+    date = pd.Timestamp(date)
+    return (name, date.strftime('%Y-%m-%d'), quarter_label(date), change_type, notes or '')
+
+_READY_REGISTRIES = set()
+
+# Open the registry, creating and seeding it on first use
+def connect_personnel_registry(path=None):
+    path = path or PERSONNEL_DB
+    is_ready = path in _READY_REGISTRIES and os.path.exists(path)
+    con = sqlite3.connect(path)
+    if is_ready:
+        return con
+    con.executescript(_PERSONNEL_SCHEMA)
+    # Seeding is claimed under a write lock, so concurrent first connections
+    # (one per session thread, or another process) seed the registry only once
+    con.execute("BEGIN IMMEDIATE")
+    with con:
+        claimed = con.execute("INSERT OR IGNORE INTO registry_meta (key, value) VALUES ('seeded', 1)").rowcount
+        if claimed and con.execute("SELECT COUNT(*) FROM personnel_changes").fetchone()[0] == 0:
+            seed = [_personnel_row(r["name"], pd.to_datetime(r["date"], format='%m/%d/%Y'), r["type"], r["notes"])
+                    for r in SEED_PERSONNEL_CHANGES]
+            con.executemany(_PERSONNEL_INSERT, seed)
+    _READY_REGISTRIES.add(path)
+    return con
+
+_PERSONNEL_INSERT = "INSERT INTO personnel_changes (name, date, quarter, type, notes) VALUES (?, ?, ?, ?, ?)"
+
+def _insert_personnel_rows(con, rows):
+    with con:
+        con.executemany(_PERSONNEL_INSERT, rows)
+
+# Record a joiner or leaver; the quarter is derived from the date
+def add_personnel_change(name, date, change_type, notes='', path=None):
+    with closing(connect_personnel_registry(path)) as con:
+        _insert_personnel_rows(con, [_personnel_row(name, date, change_type, notes)])
+
+# Bulk-load changes from a CSV with name, date, type and notes columns
+def import_personnel_csv(csv_path, path=None):
+    records = pd.read_csv(csv_path, dtype=str, keep_default_na=False)
+    rows = [_personnel_row(r.name, r.date, r.type, r.notes if 'notes' in records.columns else '')
+            for r in records.itertuples(index=False)]
+    with closing(connect_personnel_registry(path)) as con:
+        _insert_personnel_rows(con, rows)
+    return len(rows)
+
+# Changes bump the revision through triggers, so the cached frames go stale with it
+def personnel_registry_version(path=None):
+    with closing(connect_personnel_registry(path)) as con:
+        revision = con.execute("SELECT value FROM registry_meta WHERE key = 'revision'").fetchone()[0]
+    return f"{revision}-{os.stat(path or PERSONNEL_DB).st_mtime_ns}"
+
+def _personnel_where(quarter=None, change_type=None, start=None, end=None):
+    clauses, params = [], []
+    for clause, value in (("quarter = ?", quarter), ("type = ?", change_type)):
+        if value is not None:
+            clauses.append(clause)
+            params.append(value)
+    if start is not None:
+        clauses.append("date >= ?")
+        params.append(pd.Timestamp(start).strftime('%Y-%m-%d'))
+    if end is not None:
+        clauses.append("date <= ?")
+        params.append(pd.Timestamp(end).strftime('%Y-%m-%d'))
+    return (' WHERE ' + ' AND '.join(clauses) if clauses else ''), params
+
+# Indexed lookup of personnel changes, optionally one page of them in a given order
+@metrics.timed()
+def query_personnel_changes(quarter=None, change_type=None, start=None, end=None,
+                            sort_by='date', descending=False, limit=None, offset=0, path=None):
+    if sort_by not in ('date', 'name', 'type'):
+        raise ValueError(f"Cannot sort personnel changes by {sort_by}")
+    where, params = _personnel_where(quarter, change_type, start, end)
+    sql = (f"SELECT name, date, notes, quarter, type FROM personnel_changes{where} "
+           f"ORDER BY {sort_by} {'DESC' if descending else 'ASC'}, id")
+    if limit is not None:
+        sql += " LIMIT ? OFFSET ?"
+        params += [int(limit), int(offset)]
+    with closing(connect_personnel_registry(path)) as con:
+        df = pd.read_sql_query(sql, con, params=params)
+    df['date'] = pd.to_datetime(df['date'], format='%Y-%m-%d')
+    return df
+
+@metrics.timed()
+def count_personnel_changes(quarter=None, change_type=None, start=None, end=None, path=None):
+    where, params = _personnel_where(quarter, change_type, start, end)
+    with closing(connect_personnel_registry(path)) as con:
+        return con.execute(f"SELECT COUNT(*) FROM personnel_changes{where}", params).fetchone()[0]
+
+# Create personnel summary metrics
+@metrics.timed()
+def create_personnel_summary(personnel_df):
+    summary = personnel_df.groupby(['quarter', 'type']).size().unstack(fill_value=0)
+    # Quarter labels ("Q4 2024") do not sort chronologically as text
+    quarter_starts = personnel_df.groupby('quarter')['date'].min()
+    summary = summary.loc[quarter_starts.sort_values().index].reset_index()
+    if 'Joiner' not in summary.columns:
+        summary['Joiner'] = 0
+    if 'Leaver' not in summary.columns:
+        summary['Leaver'] = 0
+    summary['Net Change'] = summary['Joiner'] - summary['Leaver']
+    summary.columns.name = None
+    return summary
+
+# First and last day of a quarter label such as "Q4 2024"
+def quarter_bounds(label):
+    quarter, year = label.split()
+    period = pd.Period(f"{year}{quarter}", freq='Q')
+    return period.start_time, period.end_time.normalize()
+
+# Highest billing Originators, optionally limited to a range of invoice months
+def top_attorneys(engine, metric='Invoice_Total_in_USD', top_n=10, start=None, end=None):
+    ranking = engine.top_originators(metric, top_n, start, end)
+    return ranking.rename_axis('Originator').reset_index()
+
+# Departing attorneys, largest billers first
+def leaver_impact(impact_df):
+    leavers = impact_df[impact_df['type'] == 'Leaver'].rename(columns={'name': 'Attorney'})
+    return leavers.sort_values('Total_Billed', ascending=False)
+
+EXPORT_DIR = os.path.join(INVOICE_CACHE_DIR, "exports")
+EXPORT_CHUNK_ROWS = 50000
+# Cached export files kept on disk; the least recently written are removed first
+EXPORT_CACHE_LIMIT = 20
+EXPORT_FORMATS = {
+    'CSV': ('csv', 'text/csv'),
+    'Excel': ('xlsx', 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'),
+    'Parquet': ('parquet', 'application/vnd.apache.parquet'),
+}
+_EXCEL_MAX_ROWS = 1048576
+
+# Yield a frame in row slices so exporters never build a second full copy
+def iter_frame_chunks(df, chunk_rows=EXPORT_CHUNK_ROWS):
+    if df.empty:
+        yield df
+    for start in range(0, len(df), chunk_rows):
+        yield df.iloc[start:start + chunk_rows]
+
+def _write_csv_export(chunks, path, sheet_name):
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        for i, chunk in enumerate(chunks):
+            chunk.to_csv(f, index=False, header=(i == 0))
+
+# xlsxwriter's constant_memory mode flushes each row as soon as the next one starts
+def _write_excel_export(chunks, path, sheet_name):
+    import xlsxwriter
+
+    workbook = xlsxwriter.Workbook(path, {'constant_memory': True, 'default_date_format': 'mm/dd/yyyy'})
+    sheet, row, sheets = None, _EXCEL_MAX_ROWS, 0
+    for chunk in chunks:
+        records = chunk.astype(object).where(chunk.notna(), None)
+        for record in records.itertuples(index=False, name=None):
+            if row == _EXCEL_MAX_ROWS:
+                # Spill onto a continuation sheet once Excel's row limit is reached
+                sheets += 1
+                sheet = workbook.add_worksheet(sheet_name if sheets == 1 else f"{sheet_name} ({sheets})")
+                sheet.write_row(0, 0, list(chunk.columns))
+                row = 1
+            sheet.write_row(row, 0, record)
+            row += 1
+        if sheet is None:
+            sheet = workbook.add_worksheet(sheet_name)
+            sheet.write_row(0, 0, list(chunk.columns))
+    workbook.close()
+
+def _write_parquet_export(chunks, path, sheet_name):
+    import pyarrow.parquet as pq
+
+    writer = None
+    try:
+        for chunk in chunks:
+            if writer is None:
+                schema = _arrow_schema_for(chunk)
+                writer = pq.ParquetWriter(path, schema)
+            writer.write_table(pa.Table.from_pandas(chunk, schema=schema, preserve_index=False))
+    finally:
+        if writer is not None:
+            writer.close()
+
+_EXPORT_WRITERS = {'csv': _write_csv_export, 'xlsx': _write_excel_export, 'parquet': _write_parquet_export}
+
+def _prune_exports():
+    exports = sorted((entry for entry in os.scandir(EXPORT_DIR) if entry.is_file()),
+                     key=lambda entry: entry.stat().st_mtime, reverse=True)
+    for entry in exports[EXPORT_CACHE_LIMIT:]:
+        os.remove(entry.path)
+
+# Identify an export's content: the data version and the filters applied to it
+def export_key(name, version, filters):
+    return hashlib.sha256(json.dumps([name, version, filters], sort_keys=True, default=str).encode()).hexdigest()[:16]
+
+# Write an export at most once per data version, filter set and format
+@metrics.timed()
+def build_export(name, version, filters, export_format, iter_chunks, sheet_name):
+    extension = EXPORT_FORMATS[export_format][0]
+    path = os.path.join(EXPORT_DIR, f"{name}-{export_key(name, version, filters)}.{extension}")
+    cached = os.path.exists(path)
+    metrics.cache_lookup('exports', miss=not cached)
+    if cached:
+        return path
+    os.makedirs(EXPORT_DIR, exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    try:
+        _EXPORT_WRITERS[extension](iter_chunks(), tmp_path, sheet_name)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    _prune_exports()
+    return path
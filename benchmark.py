@@ -0,0 +1,275 @@
+# Benchmarks for the data pipeline on seeded synthetic data. Each stage is
+# timed and memory-profiled, then compared with a stored baseline.
+#
+#   python benchmark.py --size 1m                   # run and compare with the baseline
+#   python benchmark.py --size 1m --save-baseline   # record this machine's numbers
+#
+# Exits 1 on a regression and 2 when the size has no baseline to compare with.
+# benchmark_baseline.json holds a reference 10k run; re-record it on the machine
+# that runs the comparison, since timings do not transfer between machines.
+import argparse
+import json
+import logging
+import os
+import resource
+import shutil
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+import analytics
+import metrics
+
+BENCHMARK_SIZES = {'10k': 10_000, '1m': 1_000_000, '10m': 10_000_000}
+BENCHMARK_DIR = ".benchmark"
+BASELINE_PATH = "benchmark_baseline.json"
+# Slower than baseline by more than this factor counts as a regression
+REGRESSION_TOLERANCE = 1.25
+# Timings below this are too noisy to compare
+_MIN_COMPARABLE_SECONDS = 0.1
+_GENERATE_CHUNK_ROWS = 1_000_000
+
+_FIRST_NAMES = ['James', 'Mary', 'Robert', 'Patricia', 'John', 'Jennifer', 'Michael', 'Linda', 'David',
+                'Elizabeth', 'William', 'Barbara', 'Richard', 'Susan', 'Joseph', 'Jessica', 'Thomas',
+                'Sarah', 'Charles', 'Karen', 'Daniel', 'Nancy', 'Matthew', 'Lisa', 'Anthony', 'Betty',
+                'Mark', 'Margaret', 'Steven', 'Sandra']
+_LAST_NAMES = ['Smith', 'Johnson', 'Williams', 'Brown', 'Jones', 'Garcia', 'Miller', 'Davis', 'Rodriguez',
+               'Martinez', 'Hernandez', 'Lopez', 'Gonzalez', 'Wilson', 'Anderson', 'Thomas', 'Taylor',
+               'Moore', 'Jackson', 'Martin', 'Lee', 'Perez', 'Thompson', 'White', 'Harris', 'Sanchez',
+               'Clark', 'Ramirez', 'Lewis', 'Robinson', 'Walker', 'Young', 'Allen', 'King', 'Wright',
+               'Scott', 'Torres', 'Nguyen', 'Hill', 'Flores', 'Green', 'Adams', 'Nelson', 'Baker', 'Hall',
+               'Rivera', 'Campbell', 'Mitchell', 'Carter', 'Roberts']
+_OFFICES = ['New York', 'Los Angeles', 'San Francisco', 'Boston', 'Chicago', 'Miami', 'Tel Aviv']
+_FIRST_DAY = pd.Timestamp('2022-01-01')
+_DAY_SPAN = 1277  # through 2025-06-30
+
+# Distinct "First M. Last" names; tens of thousands are available
+def synthetic_people(count, rng):
+    first, initial, last = np.meshgrid(np.arange(len(_FIRST_NAMES)), np.arange(26), np.arange(len(_LAST_NAMES)))
+    picks = rng.choice(first.size, size=count, replace=False)
+    return [f"{_FIRST_NAMES[f]} {chr(65 + i)}. {_LAST_NAMES[l]}"
+            for f, i, l in zip(first.ravel()[picks], initial.ravel()[picks], last.ravel()[picks])]
+
+# Amounts as an extract writes them: "$1,234.50", "1234.50", "(1,234.50)", "-" and blanks
+def dirty_money(amounts, rng):
+    magnitude = pd.Series(np.abs(amounts))
+    style = rng.integers(0, 4, len(amounts))
+    text = magnitude.map('{:,.2f}'.format).to_numpy(dtype=object)
+    text = np.where(style == 0, '$' + text, text)
+    text = np.where(style == 1, magnitude.map('{:.2f}'.format).to_numpy(dtype=object), text)
+    negative = amounts < 0
+    text = np.where(negative & (style == 2), '(' + text + ')', np.where(negative, '-' + text, text))
+    text[amounts == 0] = '-'
+    text[rng.random(len(amounts)) < 0.005] = ''
+    return text
+
+# Dates mostly in the extract's ISO format, with some US-style stragglers
+def mixed_dates(days, rng, missing=0.0):
+    dates = pd.DatetimeIndex(_FIRST_DAY + pd.to_timedelta(days, unit='D'))
+    text = np.where(rng.random(len(days)) < 0.1, dates.strftime('%m/%d/%Y'), dates.strftime('%Y-%m-%d'))
+    text[rng.random(len(days)) < missing] = ''
+    return text
+
+def synthetic_invoice_chunk(start, rows, originators, rng):
+    totals = np.round(rng.lognormal(8, 1.5, rows), 2)
+    totals[rng.random(rows) < 0.03] *= -1
+    totals[rng.random(rows) < 0.02] = 0
+    labor = np.round(totals * 0.8, 2)
+    balance = np.round(np.abs(totals) * rng.random(rows) * (rng.random(rows) < 0.3), 2)
+    names = np.asarray(originators, dtype=object)[rng.integers(0, len(originators), rows)]
+    days = rng.integers(0, _DAY_SPAN, rows)
+    return pd.DataFrame({
+        'Invoice_Number': np.arange(start, start + rows),
+        'Originator': names,
+        'Invoice_Date': mixed_dates(days, rng),
+        'Invoice_Total_in_USD': dirty_money(totals, rng),
+        'Invoice_Labor_Total_in_USD': labor,
+        'Invoice_Expense_Total_in_USD': np.round(totals - labor, 2),
+        'Invoice_Balance_Due_in_USD': dirty_money(balance, rng),
+        'Payments_Applied_Against_Invoice_in_USD': np.round(np.abs(totals) - balance, 2),
+        'Last payment date': mixed_dates(np.minimum(days + rng.integers(0, 90, rows), _DAY_SPAN), rng, 0.4),
+        'Office': np.asarray(_OFFICES, dtype=object)[rng.integers(0, len(_OFFICES), rows)],
+    })
+
+# Write the invoice extract a chunk at a time so 10M rows never sit in memory
+def generate_invoices(path, rows, people, seed=0):
+    rng = np.random.default_rng(seed)
+    # Some extracts list an Originator as "Last, First M."
+    originators = people + [f"{name.split()[-1]}, {' '.join(name.split()[:-1])}" for name in people[::10]]
+    for start in range(0, rows, _GENERATE_CHUNK_ROWS):
+        chunk = synthetic_invoice_chunk(start, min(_GENERATE_CHUNK_ROWS, rows - start), originators, rng)
+        chunk.to_csv(path, mode='w' if start == 0 else 'a', header=(start == 0), index=False)
+
+def generate_personnel(path, people, seed=0):
+    rng = np.random.default_rng(seed)
+    dates = _FIRST_DAY + pd.to_timedelta(rng.integers(0, _DAY_SPAN, len(people)), unit='D')
+    types = np.where(rng.random(len(people)) < 0.5, 'Joiner', 'Leaver')
+    rows = [analytics._personnel_row(name, date, change_type, 'synthetic')
+            for name, date, change_type in zip(people, dates, types)]
+    if os.path.exists(path):
+        os.remove(path)
+    con = analytics.connect_personnel_registry(path)
+    try:
+        # Replace the seed records a new registry starts with
+        con.execute("DELETE FROM personnel_changes")
+        analytics._insert_personnel_rows(con, rows)
+    finally:
+        con.close()
+
+# Generated inputs are reused across runs with the same size, seed and headcount
+def prepare_workdir(rows, personnel, seed):
+    workdir = os.path.join(BENCHMARK_DIR, f"{rows}-{personnel}-{seed}")
+    csv_path = os.path.join(workdir, analytics.INVOICE_CSV)
+    os.makedirs(workdir, exist_ok=True)
+    people = synthetic_people(personnel, np.random.default_rng(seed))
+    if not os.path.exists(csv_path):
+        print(f"Generating {rows:,} invoices for {personnel:,} people...", file=sys.stderr)
+        generate_invoices(f"{csv_path}.tmp", rows, people, seed)
+        os.replace(f"{csv_path}.tmp", csv_path)
+    generate_personnel(os.path.join(workdir, 'personnel.db'), people, seed)
+    return workdir
+
+def _max_rss_bytes():
+    usage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return usage if sys.platform == 'darwin' else usage * 1024
+
+# Run one stage, recording wall time, the peak of Python-visible allocations
+# (numpy and pandas buffers included; Arrow's own pool is not traced), how much
+# the stage grew resident memory, and the whole process's peak RSS so far
+def measure(results, stage, func, trace_memory=True):
+    if trace_memory:
+        tracemalloc.start()
+    rss = metrics.current_rss()
+    started = time.perf_counter()
+    value = func()
+    seconds = time.perf_counter() - started
+    peak = 0
+    if trace_memory:
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    results[stage] = {'seconds': round(seconds, 4), 'peak_bytes': peak,
+                      'rss_delta_bytes': metrics.current_rss() - rss, 'process_peak_rss_bytes': _max_rss_bytes()}
+    return value
+
+def run_stages(rows, export_formats, trace_memory=True):
+    results = {}
+    shutil.rmtree(analytics.INVOICE_CACHE_DIR, ignore_errors=True)
+    measure(results, 'load_invoice_data (cold)', analytics.read_invoice_data, trace_memory)
+    measure(results, 'load_invoice_data (cached)', analytics.read_invoice_data, trace_memory)
+    df = measure(results, 'compact_invoice_frame',
+                 lambda: analytics.compact_invoice_frame(analytics.read_invoice_data(analytics.DASHBOARD_COLUMNS)),
+                 trace_memory)
+    personnel = measure(results, 'load_personnel_changes', analytics.query_personnel_changes, trace_memory)
+    measure(results, 'create_personnel_summary', lambda: analytics.create_personnel_summary(personnel),
+            trace_memory)
+
+    engine = measure(results, 'invoice cube',
+                     lambda: analytics.PandasInvoiceEngine(df, analytics.load_invoice_cube()), trace_memory)
+    shared = analytics.SharedInvoiceData(engine)
+    totals = measure(results, 'originator totals',
+                     lambda: engine.originator_totals('Invoice_Total_in_USD'), trace_memory)
+    measure(results, 'top attorneys', lambda: analytics.top_attorneys(engine, top_n=10), trace_memory)
+    measure(results, 'leaver impact', lambda: analytics.leaver_impact(
+        analytics.personnel_impact(personnel, totals, shared.originator_index)), trace_memory)
+    measure(results, 'billing windows', lambda: analytics.personnel_billing_windows(
+        engine, personnel, shared.originator_index), trace_memory)
+    index = measure(results, 'filter index', lambda: shared.filter_index, trace_memory)
+    first, last = index.date_range
+    measure(results, 'filter select', lambda: index.select(
+        first + (last - first) / 4, last - (last - first) / 4, list(index.originators[:50]), statuses=['Paid']),
+        trace_memory)
+
+    # The table renders outside a Streamlit session, where widgets return their defaults
+    logging.disable(logging.WARNING)
+    import main as dashboard
+    measure(results, 'display_personnel_table',
+            lambda: dashboard.display_personnel_table(analytics.personnel_registry_version()), trace_memory)
+    logging.disable(logging.NOTSET)
+
+    shutil.rmtree(analytics.EXPORT_DIR, ignore_errors=True)
+    for label in export_formats:
+        extension = analytics.EXPORT_FORMATS[label][0]
+        if extension == 'xlsx' and rows > analytics._EXCEL_MAX_ROWS:
+            continue
+        measure(results, f'export {extension}', lambda: analytics.build_export(
+            'invoices', engine.version, {}, label, engine.iter_chunks, 'Invoices'), trace_memory)
+    return results
+
+def load_baseline(path=BASELINE_PATH):
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+def save_baseline(size, results, path=BASELINE_PATH):
+    baseline = load_baseline(path)
+    baseline[size] = results
+    analytics._write_json_atomic(path, baseline)
+
+# Stages slower than baseline * tolerance, as (stage, seconds, baseline seconds)
+def find_regressions(results, baseline, tolerance=REGRESSION_TOLERANCE):
+    regressions = []
+    for stage, result in results.items():
+        previous = baseline.get(stage)
+        if previous is None or previous['seconds'] < _MIN_COMPARABLE_SECONDS:
+            continue
+        if result['seconds'] > previous['seconds'] * tolerance:
+            regressions.append((stage, result['seconds'], previous['seconds']))
+    return regressions
+
+def format_report(results, baseline):
+    lines = [f"{'Stage':<30} {'Seconds':>9} {'Baseline':>9} {'Ratio':>6} {'Peak MB':>9} {'RSS +MB':>9} "
+             f"{'Process peak RSS MB':>20}"]
+    for stage, result in results.items():
+        previous = baseline.get(stage)
+        reference = f"{previous['seconds']:>9.3f}" if previous else f"{'-':>9}"
+        ratio = (f"{result['seconds'] / previous['seconds']:>6.2f}"
+                 if previous and previous['seconds'] else f"{'-':>6}")
+        lines.append(f"{stage:<30} {result['seconds']:>9.3f} {reference} {ratio} "
+                     f"{result['peak_bytes'] / 2**20:>9.1f} {result['rss_delta_bytes'] / 2**20:>9.1f} "
+                     f"{result['process_peak_rss_bytes'] / 2**20:>20.1f}")
+    return '\n'.join(lines)
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Time and memory-profile the dashboard's data pipeline.")
+    parser.add_argument('--size', choices=BENCHMARK_SIZES, default='10k')
+    parser.add_argument('--personnel', type=int, default=2000, help="people in the synthetic registry")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--export-format', action='append', dest='export_formats',
+                        choices=list(analytics.EXPORT_FORMATS),
+                        help="repeatable (default: all; Excel is skipped past its row limit)")
+    parser.add_argument('--no-memory', action='store_true', help="skip tracemalloc, which slows every stage")
+    parser.add_argument('--save-baseline', action='store_true')
+    parser.add_argument('--baseline', default=BASELINE_PATH)
+    parser.add_argument('--tolerance', type=float, default=REGRESSION_TOLERANCE)
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    rows = BENCHMARK_SIZES[args.size]
+    baseline_path = os.path.abspath(args.baseline)
+    workdir = prepare_workdir(rows, args.personnel, args.seed)
+    # Every default path (extract, Arrow cache, registry, exports) resolves inside the workdir
+    os.chdir(workdir)
+    results = run_stages(rows, args.export_formats or list(analytics.EXPORT_FORMATS), not args.no_memory)
+    baseline = load_baseline(baseline_path).get(args.size, {})
+    print(format_report(results, baseline))
+    if args.save_baseline:
+        save_baseline(args.size, results, baseline_path)
+        print(f"Saved {args.size} baseline to {baseline_path}")
+        return 0
+    if not baseline:
+        # Nothing to compare with is a failure, not a pass
+        print(f"No {args.size} baseline in {baseline_path}; record one with --save-baseline",
+              file=sys.stderr)
+        return 2
+    regressions = find_regressions(results, baseline, args.tolerance)
+    for stage, seconds, previous in regressions:
+        print(f"REGRESSION {stage}: {seconds:.3f}s vs {previous:.3f}s baseline", file=sys.stderr)
+    return 1 if regressions else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,10 +1,24 @@
+import time
+# Taken before anything else so the first run's imports count towards first paint
+_RUN_STARTED = time.perf_counter()
+
 import streamlit as st
 import pandas as pd
-import plotly.express as px
-import plotly.graph_objects as go
-from datetime import datetime
-import base64
-import io
+import numpy as np
+from collections import OrderedDict
+import importlib.util
+import threading
+
+import metrics
+
+from analytics import (
+    BILLING_WINDOWS, DASHBOARD_COLUMNS, EXPORT_FORMATS, INVOICE_BACKEND, PAYMENT_STATUSES,
+    DuckDBInvoiceEngine, PandasInvoiceEngine, SharedInvoiceData, StaleWhileRevalidate, SubsetInvoiceEngine,
+    attach_originators, build_export, compact_invoice_frame, count_personnel_changes, create_personnel_summary,
+    current_invoice_version, export_key, iter_frame_chunks, leaver_impact, load_invoice_cube, pa,
+    personnel_billing_windows, personnel_impact, personnel_registry_version, query_personnel_changes,
+    read_invoice_data, top_attorneys,
+)
 
 # Set page configuration
 st.set_page_config(page_title="Rimon Personnel Changes", page_icon="👥", layout="wide")
@@ -30,198 +44,415 @@ st.markdown("""
 </style>
 """, unsafe_allow_html=True)
 
-# Load invoice data
-@st.cache_data(ttl=3600)
-def load_invoice_data():
+# The shared dataset is reloaded in the background once it is this old
+SHARED_DATA_TTL = 3600
+# ...or this soon after a load failed
+SHARED_DATA_RETRY = 30
+# Filtered invoice engines kept at once
+FILTERED_ENGINE_CACHE_SIZE = 8
+
+def parse_report_warnings(report):
+    return [('warning', f"{failed:,} values in {col} could not be parsed") for col, failed in report.items() if failed]
+
+# Load invoice data (all columns unless a subset is requested). This may run on a
+# background thread, so problems are returned for the page to show, not shown here.
+def load_invoice_data(columns=None, source=None):
     try:
-        df = pd.read_csv("Cleaned_Invoice_Data.csv", encoding='utf-8')
-        df.columns = df.columns.str.strip()
-        
-        # Clean money columns
-        money_cols = ['Invoice_Total_in_USD', 'Invoice_Labor_Total_in_USD', 'Invoice_Expense_Total_in_USD', 
-                      'Invoice_Balance_Due_in_USD', 'Payments_Applied_Against_Invoice_in_USD', 
-                      'Original Inv. Total', 'Payments Received']
-        
-        for col in money_cols:
-            if col in df.columns:
-                try:
-                    df[col] = df[col].astype(str).str.replace('$', '', regex=False)
-                    df[col] = df[col].str.replace(',', '', regex=False)
-                    df[col] = df[col].str.replace('-', '0', regex=False)
-                    df[col] = pd.to_numeric(df[col], errors='coerce').fillna(0)
-                except Exception as e:
-                    st.sidebar.warning(f"Could not convert {col}: {e}")
-        
-        # Convert date columns
-        date_cols = ['Invoice_Date', 'Last payment date', 'Invoice Date']
-        for col in date_cols:
-            if col in df.columns:
-                try:
-                    df[col] = pd.to_datetime(df[col], errors='coerce')
-                except Exception as e:
-                    st.sidebar.warning(f"Could not convert {col} to date: {e}")
-        
-        return df
+        df = read_invoice_data(columns, source)
+        return df, parse_report_warnings(df.attrs['parse_report'])
     except Exception as e:
-        st.error(f"Error loading invoice data: {e}")
-        return pd.DataFrame(columns=['Invoice_Number'])
-
-# Load personnel data
-def load_personnel_changes():
-    # Q4 2024 Leavers
-    leavers_q4_2024 = [
-        {"name": "Matthew Poppe", "date": "10/16/2024", "notes": ""},
-        {"name": "Marc Kaufman", "date": "11/13/2024", "notes": ""},
-        {"name": "Steven Eichel", "date": "11/19/2024", "notes": ""},
-        {"name": "Chelsea Ellis", "date": "11/19/2024", "notes": "Did not originate"},
-        {"name": "Sam Finkelstein", "date": "11/19/2024", "notes": "Did not originate"},
-        {"name": "T. James Min", "date": "11/19/2024", "notes": ""},
-        {"name": "Jeffrey Fromm", "date": "11/21/2024", "notes": ""},
-        {"name": "David Mahoney", "date": "11/21/2024", "notes": ""},
-        {"name": "J Paul Gignac", "date": "12/2/2024", "notes": ""},
-        {"name": "Deborah Turofsky", "date": "12/5/2024", "notes": "Did not originate"},
-        {"name": "David Mittelman", "date": "12/18/2024", "notes": ""},
-        {"name": "Dale Rieger", "date": "12/20/2024", "notes": ""}
-    ]
+        return pd.DataFrame(columns=['Invoice_Number']), [('error', f"Error loading invoice data: {e}")]
+
+def show_load_messages(messages):
+    for level, message in messages:
+        if level == 'error':
+            st.error(message)
+        else:
+            st.sidebar.warning(message)
+
+# Bytes shared across sessions versus bytes this session allocated on top
+def memory_report(shared, views, session_frames=(), filtered_engines=None):
+    session_bytes = sum(view.allocated_bytes for view in views)
+    session_bytes += sum(int(frame.memory_usage(deep=True).sum()) for frame in session_frames)
+    return {'shared_bytes': shared.shared_bytes, 'session_bytes': session_bytes,
+            'filtered_bytes': 0 if filtered_engines is None else filtered_engines.memory_bytes}
+
+def format_bytes(size):
+    for unit in ['B', 'KB', 'MB', 'GB']:
+        if size < 1024 or unit == 'GB':
+            return f"{size:,.1f} {unit}"
+        size /= 1024
+
+def build_shared_invoice_data():
+    metrics.cache_miss('shared_invoice_data')
+    messages = []
+    if INVOICE_BACKEND == 'duckdb':
+        if importlib.util.find_spec('duckdb') is None or pa is None:
+            messages.append(('warning', "The duckdb backend needs duckdb and pyarrow; falling back to pandas"))
+        else:
+            try:
+                engine = DuckDBInvoiceEngine()
+                shared = SharedInvoiceData(engine)
+                shared.load_messages = parse_report_warnings(engine.parse_report)
+                return shared
+            except Exception as e:
+                return empty_shared_invoice_data(e)
+    df, load_messages = load_invoice_data(DASHBOARD_COLUMNS)
+    df = compact_invoice_frame(df)
+    shared = SharedInvoiceData(PandasInvoiceEngine(df, load_invoice_cube() if len(df) else None))
+    shared.load_messages = messages + load_messages
+    # Build the filter index here, off the request path
+    shared.filter_index
+    return shared
+
+# Served when the invoices cannot be read at all, e.g. the source is missing
+def empty_shared_invoice_data(error):
+    shared = SharedInvoiceData(PandasInvoiceEngine(pd.DataFrame(columns=['Invoice_Number'])))
+    shared.load_messages = [('error', f"Error loading invoice data: {error}")]
+    return shared
+
+# Started by the first script run in the process, so the data loads while the
+# rest of that page renders; later reloads never block a request
+@st.cache_resource
+def _invoice_data_refresher():
+    return StaleWhileRevalidate(build_shared_invoice_data, SHARED_DATA_TTL, current_invoice_version,
+                                name='invoice-data-refresh', fallback=empty_shared_invoice_data,
+                                retry=SHARED_DATA_RETRY).start()
+
+def get_shared_invoice_data():
+    metrics.cache_lookup('shared_invoice_data')
+    refresher = _invoice_data_refresher()
+    if not refresher.ready:
+        with st.spinner("Loading invoice data..."):
+            return refresher.get()
+    return refresher.get()
+
+@st.cache_data(max_entries=256)
+def _cached_personnel_query(version, **query):
+    metrics.cache_miss('personnel_query')
+    return query_personnel_changes(**query)
+
+@st.cache_data(max_entries=256)
+def _cached_personnel_count(version, **query):
+    metrics.cache_miss('personnel_count')
+    return count_personnel_changes(**query)
+
+# The range of a view filtered by invoice date alone, when it spans whole
+# months; the shared cube answers those without an engine over the rows
+def whole_month_range(invoice_view):
+    key = invoice_view.key
+    if key is None or None in key[:2] or any(key[2:]):
+        return None
+    start, end = pd.Timestamp(key[0]), pd.Timestamp(key[1])
+    if start.day != 1 or not end.is_month_end:
+        return None
+    return start, end
+
+def cached_personnel_query(version, **query):
+    metrics.cache_lookup('personnel_query')
+    return _cached_personnel_query(version, **query)
+
+def cached_personnel_count(version, **query):
+    metrics.cache_lookup('personnel_count')
+    return _cached_personnel_count(version, **query)
+
+FIGURE_CACHE_SIZE = 64
+
+# Sidebar invoice filters; returns the view of the shared data that matches them
+def filtered_invoice_view(shared):
+    index = shared.filter_index
+    if index is None:
+        if shared.row_count:
+            st.sidebar.caption("Invoice filters need the in-memory (pandas) backend.")
+        return shared.view()
     
-    # Q1 2025 Leavers
-    leavers_q1_2025 = [
-        {"name": "Dror Futter", "date": "2/28/2025", "notes": ""},
-        {"name": "Leo Liu", "date": "3/1/2025", "notes": ""}
-    ]
+    filters = {}
+    first, last = index.date_range
+    if first is not None:
+        full_range = (first.date(), last.date())
+        picked = st.sidebar.date_input("Invoice Date", value=full_range, min_value=full_range[0],
+                                       max_value=full_range[1])
+        # While a range is being picked the widget holds a single date
+        if isinstance(picked, (tuple, list)) and len(picked) == 2 and tuple(picked) != full_range:
+            filters['start'], filters['end'] = picked
     
-    # Q4 2024 Joiners
-    joiners_q4_2024 = [
-        {"name": "Tim Kennedy", "date": "10/7/2024", "notes": "PCT Team Associate"},
-        {"name": "Patrick McCormick", "date": "10/15/2024", "notes": ""},
-        {"name": "Jake Mendoza", "date": "11/18/2024", "notes": "PCT Team Partner"},
-        {"name": "Sarah Challen McKee", "date": "11/18/2024", "notes": "PCT Team Associate"},
-        {"name": "Ruben Salcido Monreal", "date": "11/18/2024", "notes": "Associate"},
-        {"name": "Robert Pepple", "date": "12/2/2024", "notes": ""},
-        {"name": "Sydney Blomstrom", "date": "12/2/2024", "notes": "Associate"},
-        {"name": "Edwin Barkel", "date": "12/16/2024", "notes": "BOB shared with Hilary Wells"},
-        {"name": "Hilary Wells", "date": "12/16/2024", "notes": "BOB shared with Ed Barkel"}
-    ]
+    originators = st.sidebar.multiselect("Originator", options=sorted(index.originators))
+    if originators:
+        filters['originators'] = originators
     
-    # Q1 2025 Joiners
-    joiners_q1_2025 = [
-        {"name": "Ivan Moskowitz", "date": "1/6/2025", "notes": ""},
-        {"name": "Chip Fisher", "date": "2/3/2025", "notes": "PCT Team Counsel"},
-        {"name": "Lisel Ferguson", "date": "2/24/2025", "notes": ""},
-        {"name": "Hua Howard Wang", "date": "3/12/2025", "notes": ""}
-    ]
+    if index.has_balance:
+        low, high = (float(bound) for bound in index.balance_range)
+        if low < high:
+            picked = st.sidebar.slider("Balance Due (USD)", min_value=low, max_value=high, value=(low, high))
+            if picked != (low, high):
+                filters['balance'] = picked
     
-    # Create DataFrames
-    leavers_q4_df = pd.DataFrame(leavers_q4_2024)
-    leavers_q4_df['quarter'] = 'Q4 2024'
-    leavers_q4_df['type'] = 'Leaver'
+    if index.has_status:
+        statuses = st.sidebar.multiselect("Payment Status", options=list(PAYMENT_STATUSES))
+        if statuses:
+            filters['statuses'] = statuses
     
-    leavers_q1_df = pd.DataFrame(leavers_q1_2025)
-    leavers_q1_df['quarter'] = 'Q1 2025'
-    leavers_q1_df['type'] = 'Leaver'
+    rows = index.select(**filters)
+    if rows is not None:
+        st.sidebar.caption(f"{len(rows):,} of {index.row_count:,} invoices match")
+    return shared.view(rows, index.filter_key(**filters))
+
+# Offer a download that is only generated when asked for, then served from disk
+def offer_export(label, name, version, filters, export_format, iter_chunks, sheet_name):
+    extension, mime = EXPORT_FORMATS[export_format]
+    # One prepared flag per data version, filter set and format, so changing any
+    # of them asks for a fresh click instead of rebuilding on every rerun
+    key = f"export-{name}-{export_key(name, version, filters)}-{export_format}"
+    if not st.session_state.get(key) and not st.button(f"Prepare {label} ({export_format})", key=f"{key}-prepare"):
+        return
+    st.session_state[key] = True
+    with st.spinner(f"Preparing {label.lower()}..."):
+        path = build_export(name, version, filters, export_format, iter_chunks, sheet_name)
+    with open(path, 'rb') as f:
+        st.download_button(f"Download {label} ({export_format})", data=f,
+                           file_name=f"{name}.{extension}", mime=mime, key=f"{key}-download")
+
+PERSONNEL_PAGE_SIZE = 50
+PERSONNEL_SORT_COLUMNS = {'Date': 'date', 'Name': 'name', 'Type': 'type'}
+
+def _escape_html(values):
+    text = values.fillna('').astype(str)
+    for char, entity in (('&', '&amp;'), ('<', '&lt;'), ('>', '&gt;'), ('"', '&quot;')):
+        text = text.str.replace(char, entity, regex=False)
+    return text
+
+# Build the <tr> markup for a page of personnel rows in one vectorized pass
+def personnel_rows_html(page_df):
+    is_joiner = page_df['type'] == 'Joiner'
+    row_class = pd.Series(np.where(is_joiner, 'join-row', 'leave-row'), index=page_df.index)
+    badge_class = pd.Series(np.where(is_joiner, 'badge-join', 'badge-leave'), index=page_df.index)
+    rows = ('<tr class="' + row_class + '"><td>' + page_df['date'].dt.strftime('%m/%d/%Y').fillna('')
+            + '</td><td>' + _escape_html(page_df['name'])
+            + '</td><td><span class="badge ' + badge_class + '">' + _escape_html(page_df['type'])
+            + '</span></td><td>' + _escape_html(page_df['notes']) + '</td></tr>')
+    return ''.join(rows.tolist())
+
+# Display personnel changes table, one page at a time, straight from the registry
+def display_personnel_table(version, quarter=None, change_type=None, page_size=PERSONNEL_PAGE_SIZE):
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        sort_label = st.selectbox("Sort By", options=list(PERSONNEL_SORT_COLUMNS))
+    with col2:
+        descending = st.selectbox("Order", options=['Ascending', 'Descending']) == 'Descending'
     
-    joiners_q4_df = pd.DataFrame(joiners_q4_2024)
-    joiners_q4_df['quarter'] = 'Q4 2024'
-    joiners_q4_df['type'] = 'Joiner'
+    total_rows = cached_personnel_count(version, quarter=quarter, change_type=change_type)
+    total_pages = max(1, -(-total_rows // page_size))
+    with col3:
+        page = st.number_input("Page", min_value=1, max_value=total_pages, value=1, step=1)
     
-    joiners_q1_df = pd.DataFrame(joiners_q1_2025)
-    joiners_q1_df['quarter'] = 'Q1 2025'
-    joiners_q1_df['type'] = 'Joiner'
+    start = (int(page) - 1) * page_size
+    page_df = cached_personnel_query(version, quarter=quarter, change_type=change_type,
+                                     sort_by=PERSONNEL_SORT_COLUMNS[sort_label], descending=descending,
+                                     limit=page_size, offset=start)
     
-    # Combine all data
-    personnel_changes = pd.concat([leavers_q4_df, leavers_q1_df, joiners_q4_df, joiners_q1_df])
-    personnel_changes['date'] = pd.to_datetime(personnel_changes['date'], format='%m/%d/%Y', errors='coerce')
-    personnel_changes = personnel_changes.sort_values('date')
+    with metrics.span('personnel table html'):
+        table_html = (
+            '<table class="personnel-table"><thead><tr>'
+            '<th>Date</th><th>Name</th><th>Type</th><th>Notes</th>'
+            '</tr></thead><tbody>'
+            + personnel_rows_html(page_df)
+            + '</tbody></table>'
+        )
+        st.markdown(table_html, unsafe_allow_html=True)
+    if total_rows:
+        st.caption(f"Showing {start + 1:,}-{start + len(page_df):,} of {total_rows:,} changes "
+                   f"(page {int(page)} of {total_pages})")
+
+# Bounded LRU of built Plotly figures, keyed on data version plus view parameters
+class FigureCache:
+    cache_name = 'figures'
+    span_name = 'figure'
+
+    def __init__(self, max_size=FIGURE_CACHE_SIZE):
+        self.max_size = max_size
+        self._figures = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_or_build(self, key, build):
+        with self._lock:
+            if key in self._figures:
+                self._figures.move_to_end(key)
+                metrics.cache_lookup(self.cache_name)
+                return self._figures[key]
+        metrics.cache_lookup(self.cache_name, miss=True)
+        with metrics.span(f"{self.span_name} {key[0]}"):
+            figure = build()
+        with self._lock:
+            self._figures[key] = figure
+            while len(self._figures) > self.max_size:
+                self._figures.popitem(last=False)
+        return figure
+
+@st.cache_resource
+def get_figure_cache():
+    return FigureCache()
+
+# Engines over filtered views' rows, shared by every session showing the same
+# data version and filters, so reruns and other sessions skip the rebuild
+class FilteredEngineCache(FigureCache):
+    cache_name = 'filtered_engines'
+    span_name = 'engine'
+
+    def __init__(self, max_size=FILTERED_ENGINE_CACHE_SIZE):
+        super().__init__(max_size)
+
+    @property
+    def memory_bytes(self):
+        with self._lock:
+            return sum(engine.memory_bytes for engine in self._figures.values())
+
+@st.cache_resource
+def get_filtered_engine_cache():
+    return FilteredEngineCache()
+
+def filtered_invoice_engine(invoice_view):
+    return get_filtered_engine_cache().get_or_build(
+        ('filtered', invoice_view.version),
+        lambda: SubsetInvoiceEngine(invoice_view.shared.df, invoice_view.rows))
+
+def quarterly_changes_figure(personnel_summary):
+    import plotly.express as px
+
+    quarter_summary = personnel_summary.melt(
+        id_vars=['quarter'],
+        value_vars=['Joiner', 'Leaver'],
+        var_name='Type',
+        value_name='Count'
+    )
     
-    return personnel_changes
-
-# Create personnel summary metrics
-def create_personnel_summary(personnel_df):
-    summary = personnel_df.groupby(['quarter', 'type']).size().unstack(fill_value=0).reset_index()
-    if 'Joiner' not in summary.columns:
-        summary['Joiner'] = 0
-    if 'Leaver' not in summary.columns:
-        summary['Leaver'] = 0
-    summary['Net Change'] = summary['Joiner'] - summary['Leaver']
-    return summary
-
-# Download data as CSV
-def download_csv(df):
-    csv = df.to_csv(index=False)
-    b64 = base64.b64encode(csv.encode()).decode()
-    href = f'<a href="data:file/csv;base64,{b64}" download="personnel_changes.csv" class="download-button">Download CSV</a>'
-    return href
-
-# Download data as Excel
-def download_excel(df):
-    output = io.BytesIO()
-    with pd.ExcelWriter(output, engine='xlsxwriter') as writer:
-        df.to_excel(writer, index=False, sheet_name='Personnel Changes')
-    excel_data = output.getvalue()
-    b64 = base64.b64encode(excel_data).decode()
-    href = f'<a href="data:application/vnd.openxmlformats-officedocument.spreadsheetml.sheet;base64,{b64}" download="personnel_changes.xlsx" class="download-button">Download Excel</a>'
-    return href
-
-# Display personnel changes table
-def display_personnel_table(personnel_df, quarter=None, change_type=None):
-    filtered_df = personnel_df.copy()
-    if quarter:
-        filtered_df = filtered_df[filtered_df['quarter'] == quarter]
-    if change_type:
-        filtered_df = filtered_df[filtered_df['type'] == change_type]
+    return px.bar(
+        quarter_summary,
+        x='quarter',
+        y='Count',
+        color='Type',
+        barmode='group',
+        labels={'quarter': 'Quarter', 'Count': 'Number of Personnel', 'Type': 'Change Type'},
+        color_discrete_map={'Joiner': '#10B981', 'Leaver': '#EF4444'}
+    )
+
+def monthly_activity_figure(personnel_df):
+    import plotly.graph_objects as go
+
+    personnel_df = personnel_df.assign(month=personnel_df['date'].dt.strftime('%Y-%m'))
+    monthly_joiners = personnel_df[personnel_df['type'] == 'Joiner'].groupby('month').size().reset_index()
+    monthly_joiners.columns = ['month', 'count']
     
-    filtered_df['formatted_date'] = filtered_df['date'].dt.strftime('%m/%d/%Y')
-    filtered_df = filtered_df.sort_values('date')
+    monthly_leavers = personnel_df[personnel_df['type'] == 'Leaver'].groupby('month').size().reset_index()
+    monthly_leavers.columns = ['month', 'count']
     
-    table_html = """
-    <table class="personnel-table">
-        <thead>
-            <tr>
-                <th>Date</th>
-                <th>Name</th>
-                <th>Type</th>
-                <th>Notes</th>
-            </tr>
-        </thead>
-        <tbody>
-    """
+    fig = go.Figure()
+    fig.add_trace(go.Bar(
+        x=monthly_joiners['month'],
+        y=monthly_joiners['count'],
+        name='Joiners',
+        marker_color='#10B981'
+    ))
     
-    for _, row in filtered_df.iterrows():
-        row_class = "join-row" if row['type'] == 'Joiner' else "leave-row"
-        badge_class = "badge-join" if row['type'] == 'Joiner' else "badge-leave"
-        
-        table_html += f"""
-        <tr class="{row_class}">
-            <td>{row['formatted_date']}</td>
-            <td>{row['name']}</td>
-            <td><span class="badge {badge_class}">{row['type']}</span></td>
-            <td>{row['notes']}</td>
-        </tr>
-        """
+    fig.add_trace(go.Bar(
+        x=monthly_leavers['month'],
+        y=monthly_leavers['count'],
+        name='Leavers',
+        marker_color='#EF4444'
+    ))
     
-    table_html += """
-        </tbody>
-    </table>
-    """
+    fig.update_layout(
+        xaxis=dict(title='Month'),
+        yaxis=dict(title='Number of Personnel'),
+        barmode='group'
+    )
+    return fig
+
+def top_attorneys_figure(top_attorneys, top_n):
+    import plotly.express as px
+
+    fig = px.bar(
+        top_attorneys,
+        x='Originator',
+        y='Invoice_Total_in_USD',
+        title=f'Top {top_n} Attorneys by Billing',
+        labels={'Invoice_Total_in_USD': 'Total Billed (USD)', 'Originator': 'Attorney'},
+        color='Invoice_Total_in_USD',
+        color_continuous_scale='Blues'
+    )
     
-    st.markdown(table_html, unsafe_allow_html=True)
+    fig.update_layout(
+        xaxis_tickangle=45,
+        height=400
+    )
+    return fig
+
+def leaver_impact_figure(leaver_impact_df):
+    import plotly.express as px
+
+    fig = px.bar(
+        leaver_impact_df,
+        x='Attorney',
+        y='Total_Billed',
+        labels={'Total_Billed': 'Total Billed (USD)', 'Attorney': ''},
+        color='Total_Billed',
+        color_continuous_scale='Reds'
+    )
+    
+    fig.update_layout(xaxis_tickangle=45)
+    return fig
+
+def billing_windows_figure(windows_df, window):
+    import plotly.express as px
+
+    chart_df = windows_df.melt(id_vars=['Attorney', 'Type'], value_vars=['Before', 'After'],
+                               var_name='Period', value_name='Billed')
+    fig = px.bar(
+        chart_df,
+        x='Attorney',
+        y='Billed',
+        color='Period',
+        barmode='group',
+        facet_col='Type',
+        labels={'Billed': f'Billed within {window} days (USD)', 'Attorney': ''},
+        color_discrete_map={'Before': '#1E3A8A', 'After': '#10B981'}
+    )
+    
+    fig.update_xaxes(matches=None, tickangle=45)
+    return fig
 
 def format_currency(value):
     return f"${value:,.2f}"
 
-def main():
+def render_page():
     st.markdown("<h1 class='main-header'>Rimon Personnel Changes Dashboard</h1>", unsafe_allow_html=True)
     
     # Load data
-    df = load_invoice_data()
-    personnel_changes = load_personnel_changes()
+    with metrics.span('load data'):
+        # Invoices keep loading in the background while the personnel registry is read
+        _invoice_data_refresher()
+        personnel_version = personnel_registry_version()
+        personnel_changes = cached_personnel_query(personnel_version)
+        figure_cache = get_figure_cache()
+        shared = get_shared_invoice_data()
+        df = shared.df
     
-    if df.empty:
+    show_load_messages(shared.load_messages)
+    if not shared.row_count:
         st.warning("Invoice data could not be loaded. Some features will be limited.")
     
-    # Sidebar filters (simplified)
+    # Sidebar filters
     st.sidebar.markdown("## 🔧 Filters")
-    df_filtered = df.copy() if not df.empty else pd.DataFrame()
+    invoice_view = filtered_invoice_view(shared)
+
+    with st.sidebar.expander("Memory"):
+        report = memory_report(shared, [invoice_view], [personnel_changes], get_filtered_engine_cache())
+        st.markdown(f"Shared dataset: **{format_bytes(report['shared_bytes'])}**  \n"
+                    f"Filtered aggregates (all sessions): **{format_bytes(report['filtered_bytes'])}**  \n"
+                    f"This session: **{format_bytes(report['session_bytes'])}**")
+        compaction = df.attrs.get('compaction')
+        if compaction:
+            st.markdown(f"Invoice frame compacted from {format_bytes(compaction['before_bytes'])} "
+                        f"to {format_bytes(compaction['after_bytes'])}")
 
     # Calculate summary statistics
     personnel_summary = create_personnel_summary(personnel_changes)
@@ -233,42 +464,30 @@ def main():
         horizontal=True
     )
     
+    with metrics.span(f"view {view_selection.split(' ', 1)[1]}"):
+        render_view(view_selection, shared, invoice_view, personnel_version, personnel_changes,
+                    personnel_summary, figure_cache)
+
+def render_view(view_selection, shared, invoice_view, personnel_version, personnel_changes,
+                personnel_summary, figure_cache):
     # ===== SUMMARY VIEW =====
     if view_selection == "📊 Summary":
         st.markdown("<h2 class='section-header'>Personnel Changes Summary</h2>", unsafe_allow_html=True)
         
-        # Display summary cards
+        # Display summary cards: the two most recent quarters, then everything on record
         col1, col2, col3 = st.columns(3)
+        recent_quarters = personnel_summary.tail(2)
         
-        with col1:
-            # Q4 2024 summary
-            q4_data = personnel_summary[personnel_summary['quarter'] == 'Q4 2024']
-            if not q4_data.empty:
-                joiners = q4_data['Joiner'].values[0]
-                leavers = q4_data['Leaver'].values[0]
-                net_change = q4_data['Net Change'].values[0]
-                
-                net_color = "green-text" if net_change > 0 else "red-text" if net_change < 0 else ""
-                st.markdown(f"""
-                <div class='kpi-card'>
-                    <p>Q4 2024 Summary</p>
-                    <p><span class="green-text">{joiners} Joiners</span> | <span class="red-text">{leavers} Leavers</span></p>
-                    <p class='{net_color}'>{net_change:+d} Net Change</p>
-                </div>
-                """, unsafe_allow_html=True)
-        
-        with col2:
-            # Q1 2025 summary
-            q1_data = personnel_summary[personnel_summary['quarter'] == 'Q1 2025']
-            if not q1_data.empty:
-                joiners = q1_data['Joiner'].values[0]
-                leavers = q1_data['Leaver'].values[0]
-                net_change = q1_data['Net Change'].values[0]
+        for column, (_, quarter_data) in zip([col1, col2][2 - len(recent_quarters):], recent_quarters.iterrows()):
+            with column:
+                joiners = quarter_data['Joiner']
+                leavers = quarter_data['Leaver']
+                net_change = quarter_data['Net Change']
                 
                 net_color = "green-text" if net_change > 0 else "red-text" if net_change < 0 else ""
                 st.markdown(f"""
                 <div class='kpi-card'>
-                    <p>Q1 2025 Summary</p>
+                    <p>{quarter_data['quarter']} Summary</p>
                     <p><span class="green-text">{joiners} Joiners</span> | <span class="red-text">{leavers} Leavers</span></p>
                     <p class='{net_color}'>{net_change:+d} Net Change</p>
                 </div>
@@ -279,11 +498,13 @@ def main():
             total_joiners = personnel_summary['Joiner'].sum()
             total_leavers = personnel_summary['Leaver'].sum()
             total_net_change = total_joiners - total_leavers
+            overall_range = (f"{personnel_summary['quarter'].iloc[0]}-{personnel_summary['quarter'].iloc[-1]}"
+                             if len(personnel_summary) else "no changes recorded")
             
             net_color = "green-text" if total_net_change > 0 else "red-text" if total_net_change < 0 else ""
             st.markdown(f"""
             <div class='kpi-card'>
-                <p>Overall Summary (Q4 2024-Q1 2025)</p>
+                <p>Overall Summary ({overall_range})</p>
                 <p><span class="green-text">{total_joiners} Joiners</span> | <span class="red-text">{total_leavers} Leavers</span></p>
                 <p class='{net_color}'>{total_net_change:+d} Net Change</p>
             </div>
@@ -291,96 +512,52 @@ def main():
         
         # Bar chart - Quarterly comparison
         st.subheader("Quarterly Personnel Changes")
-        quarter_summary = personnel_summary.melt(
-            id_vars=['quarter'],
-            value_vars=['Joiner', 'Leaver'],
-            var_name='Type',
-            value_name='Count'
-        )
-        
-        fig = px.bar(
-            quarter_summary,
-            x='quarter',
-            y='Count',
-            color='Type',
-            barmode='group',
-            labels={'quarter': 'Quarter', 'Count': 'Number of Personnel', 'Type': 'Change Type'},
-            color_discrete_map={'Joiner': '#10B981', 'Leaver': '#EF4444'}
-        )
-        
+        fig = figure_cache.get_or_build(('quarterly_changes', personnel_version),
+                                        lambda: quarterly_changes_figure(personnel_summary))
         st.plotly_chart(fig, use_container_width=True)
         
         # Monthly trend chart
         st.subheader("Monthly Personnel Activity")
-        personnel_changes['month'] = personnel_changes['date'].dt.strftime('%Y-%m')
-        monthly_joiners = personnel_changes[personnel_changes['type'] == 'Joiner'].groupby('month').size().reset_index()
-        monthly_joiners.columns = ['month', 'count']
-        
-        monthly_leavers = personnel_changes[personnel_changes['type'] == 'Leaver'].groupby('month').size().reset_index()
-        monthly_leavers.columns = ['month', 'count']
-        
-        fig = go.Figure()
-        fig.add_trace(go.Bar(
-            x=monthly_joiners['month'],
-            y=monthly_joiners['count'],
-            name='Joiners',
-            marker_color='#10B981'
-        ))
-        
-        fig.add_trace(go.Bar(
-            x=monthly_leavers['month'],
-            y=monthly_leavers['count'],
-            name='Leavers',
-            marker_color='#EF4444'
-        ))
-        
-        fig.update_layout(
-            xaxis=dict(title='Month'),
-            yaxis=dict(title='Number of Personnel'),
-            barmode='group'
-        )
-        
+        fig = figure_cache.get_or_build(('monthly_activity', personnel_version),
+                                        lambda: monthly_activity_figure(personnel_changes))
         st.plotly_chart(fig, use_container_width=True)
     
     # ===== INVOICE ANALYSIS VIEW =====
     elif view_selection == "📈 Invoice Analysis":
         st.markdown("<h2 class='section-header'>Invoice-Based Personnel Analysis</h2>", unsafe_allow_html=True)
         
-        if not df_filtered.empty and 'Originator' in df_filtered.columns and 'Invoice_Date' in df_filtered.columns:
+        if invoice_view.rows is not None and invoice_view.empty:
+            st.info("No invoices match the current filters.")
+        elif shared.row_count and shared.cube is not None and 'Invoice_Month' in shared.cube.index.names:
+            # A filtered view is aggregated from its own rows only, except that a
+            # whole-month date range is read straight from the shared cube
+            month_range = whole_month_range(invoice_view)
+            start, end = month_range or (None, None)
+            if invoice_view.rows is None or month_range is not None:
+                engine = shared.engine
+            else:
+                engine = filtered_invoice_engine(invoice_view)
+            originator_totals = engine.originator_totals('Invoice_Total_in_USD', start, end)
+            originator_index = shared.originator_index
+            impact_df = personnel_impact(personnel_changes, originator_totals, originator_index)
+            
             # Top attorneys by billing
-            if 'Invoice_Total_in_USD' in df_filtered.columns:
+            if 'Invoice_Total_in_USD' in shared.cube.columns:
                 st.subheader("Top Attorneys by Billing")
                 
-                attorney_billing = df_filtered.groupby('Originator')['Invoice_Total_in_USD'].sum().reset_index()
-                attorney_billing = attorney_billing.sort_values('Invoice_Total_in_USD', ascending=False)
-                
-                top_n = min(10, len(attorney_billing))
-                top_attorneys = attorney_billing.head(top_n)
-                
-                fig = px.bar(
-                    top_attorneys,
-                    x='Originator',
-                    y='Invoice_Total_in_USD',
-                    title=f'Top {top_n} Attorneys by Billing',
-                    labels={'Invoice_Total_in_USD': 'Total Billed (USD)', 'Originator': 'Attorney'},
-                    color='Invoice_Total_in_USD',
-                    color_continuous_scale='Blues'
-                )
-                
-                fig.update_layout(
-                    xaxis_tickangle=45,
-                    height=400
-                )
+                top_n = min(10, len(originator_totals))
+                top_attorneys_df = top_attorneys(engine, 'Invoice_Total_in_USD', top_n, start, end)
                 
+                fig = figure_cache.get_or_build(('top_attorneys', invoice_view.version, top_n),
+                                                lambda: top_attorneys_figure(top_attorneys_df, top_n))
                 st.plotly_chart(fig, use_container_width=True)
                 
                 # Show which top attorneys are among joiners/leavers
                 if not personnel_changes.empty:
-                    joiners = personnel_changes[personnel_changes['type'] == 'Joiner']['name'].tolist()
-                    leavers = personnel_changes[personnel_changes['type'] == 'Leaver']['name'].tolist()
-                    
-                    top_joiners = [atty for atty in top_attorneys['Originator'] if atty in joiners]
-                    top_leavers = [atty for atty in top_attorneys['Originator'] if atty in leavers]
+                    matched = attach_originators(personnel_changes, originator_index)
+                    top_people = matched[matched['Originator'].isin(top_attorneys_df['Originator'])]
+                    top_joiners = top_people.loc[top_people['type'] == 'Joiner', 'name'].unique().tolist()
+                    top_leavers = top_people.loc[top_people['type'] == 'Leaver', 'name'].unique().tolist()
                     
                     if top_leavers:
                         st.warning(f"⚠️ {len(top_leavers)} of the top {top_n} billing attorneys are leaving: {', '.join(top_leavers)}")
@@ -390,35 +567,38 @@ def main():
             
             # Leaver financial impact
             st.subheader("Financial Impact of Departing Attorneys")
-            all_leavers = personnel_changes[personnel_changes['type'] == 'Leaver']['name'].tolist()
+            leaver_impact_df = leaver_impact(impact_df)
             
-            leaver_impact = []
-            for leaver in all_leavers:
-                if leaver in df_filtered['Originator'].values:
-                    leaver_df = df_filtered[df_filtered['Originator'] == leaver]
-                    total_billed = leaver_df['Invoice_Total_in_USD'].sum()
-                    leaver_impact.append({
-                        'Attorney': leaver,
-                        'Total_Billed': total_billed,
-                    })
-            
-            if leaver_impact:
-                leaver_impact_df = pd.DataFrame(leaver_impact)
-                leaver_impact_df = leaver_impact_df.sort_values('Total_Billed', ascending=False)
-                
-                fig = px.bar(
-                    leaver_impact_df,
-                    x='Attorney',
-                    y='Total_Billed',
-                    labels={'Total_Billed': 'Total Billed (USD)', 'Attorney': ''},
-                    color='Total_Billed',
-                    color_continuous_scale='Reds'
-                )
-                
-                fig.update_layout(xaxis_tickangle=45)
+            if not leaver_impact_df.empty:
+                fig = figure_cache.get_or_build(('leaver_impact', invoice_view.version, personnel_version),
+                                                lambda: leaver_impact_figure(leaver_impact_df))
                 st.plotly_chart(fig, use_container_width=True)
             else:
                 st.info("No revenue data found for departing attorneys in the selected time period.")
+            
+            # Billing either side of each joiner's and leaver's date
+            if 'Invoice_Total_in_USD' in shared.cube.columns and shared.engine.has_dates and not personnel_changes.empty:
+                st.subheader("Billing Before and After Personnel Changes")
+                window = st.selectbox("Window (days)", options=list(BILLING_WINDOWS), index=1)
+                # Windows are cut from the timeline of the selected rows themselves
+                windows_engine = shared.engine if invoice_view.rows is None else filtered_invoice_engine(invoice_view)
+                windows_df = personnel_billing_windows(windows_engine, personnel_changes, originator_index)
+                
+                if not windows_df.empty:
+                    before_col, after_col = f'Before_{window}d', f'After_{window}d'
+                    windows_df = windows_df.rename(columns={'name': 'Attorney', 'type': 'Type',
+                                                            before_col: 'Before', after_col: 'After'})
+                    windows_df['Change'] = windows_df['After'] - windows_df['Before']
+                    windows_df['Date'] = windows_df['date'].dt.strftime('%m/%d/%Y')
+                    fig = figure_cache.get_or_build(('billing_windows', invoice_view.version, personnel_version, window),
+                                                    lambda: billing_windows_figure(windows_df, window))
+                    st.plotly_chart(fig, use_container_width=True)
+                    st.dataframe(
+                        windows_df[['Attorney', 'Type', 'Date', 'Before', 'After', 'Change']].style.format(
+                            {'Before': format_currency, 'After': format_currency, 'Change': format_currency}),
+                        use_container_width=True, hide_index=True)
+                else:
+                    st.info("No joiners or leavers could be matched to invoice Originators.")
         else:
             st.warning("Missing invoice data required for this analysis.")
     
@@ -444,23 +624,34 @@ def main():
         filtered_type = None if selected_type == 'All' else selected_type
         
         # Display personnel table
-        display_personnel_table(personnel_changes, quarter=filtered_quarter, change_type=filtered_type)
+        display_personnel_table(personnel_version, quarter=filtered_quarter, change_type=filtered_type)
         
         # Download data section
         st.subheader("Download Data")
         
-        # Prepare download data
-        personnel_download = personnel_changes.copy()
-        personnel_download['date'] = personnel_download['date'].dt.strftime('%m/%d/%Y')
+        export_format = st.selectbox("Export Format", options=list(EXPORT_FORMATS))
+        personnel_filters = {'quarter': filtered_quarter, 'type': filtered_type}
+        
+        # Exports are built only on request, from the rows matching the active filters
+        def personnel_download():
+            download = query_personnel_changes(quarter=filtered_quarter, change_type=filtered_type)
+            download['date'] = download['date'].dt.strftime('%m/%d/%Y')
+            return download
         
         # Download buttons
         col1, col2 = st.columns(2)
         
         with col1:
-            st.markdown(download_csv(personnel_download), unsafe_allow_html=True)
+            offer_export("Personnel Changes", "personnel_changes",
+                         personnel_version, personnel_filters,
+                         export_format, lambda: iter_frame_chunks(personnel_download()), 'Personnel Changes')
         
         with col2:
-            st.markdown(download_excel(personnel_download), unsafe_allow_html=True)
+            # The DuckDB backend keeps no frame in memory, so test the row count and selection
+            if shared.row_count and (invoice_view.rows is None or len(invoice_view.rows)):
+                # Exports follow the sidebar filters
+                offer_export("Invoices", "invoices", invoice_view.version, {}, export_format,
+                             lambda: shared.engine.iter_chunks(rows=invoice_view.rows), 'Invoices')
 
         # Notes section
         with st.expander("Notes on Personnel Categories"):
@@ -471,5 +662,30 @@ def main():
             - **Did not originate**: Personnel who did not generate revenue
             """)
 
+# Where this run's time went, plus cache hit rates since the process started
+def show_performance_panel(run):
+    with st.sidebar.expander("Performance"):
+        st.markdown(f"Page run: **{run['seconds'] * 1000:,.0f} ms**, RSS {format_bytes(run['rss_bytes'])}  \n"
+                    f"Time to first paint after start: **{run['first_paint_seconds']:,.2f} s**")
+        spans = pd.DataFrame(run['spans'], columns=['name', 'depth', 'seconds', 'rss_delta_bytes'])
+        spans['Stage'] = ['\u2003' * depth + name for name, depth in zip(spans['name'], spans['depth'])]
+        spans['ms'] = spans['seconds'] * 1000
+        spans['RSS Δ MB'] = spans['rss_delta_bytes'] / 2**20
+        st.dataframe(spans[['Stage', 'ms', 'RSS Δ MB']].style.format({'ms': '{:,.1f}', 'RSS Δ MB': '{:+,.1f}'}),
+                     use_container_width=True, hide_index=True)
+        caches = pd.DataFrame.from_dict(run['caches'], orient='index', columns=['hits', 'misses', 'lookups'])
+        if not caches.empty:
+            caches['hit rate'] = caches['hits'] / caches['lookups']
+            st.dataframe(caches.style.format({'hit rate': '{:.0%}'}), use_container_width=True)
+
+def main():
+    metrics.start_run()
+    with metrics.span('page'):
+        render_page()
+    metrics.record_paint(time.perf_counter() - _RUN_STARTED)
+    run = metrics.finish_run()
+    if run is not None:
+        show_performance_panel(run)
+
 if __name__ == "__main__":
     main()
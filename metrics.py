@@ -0,0 +1,218 @@
+# Lightweight timing/memory spans and cache counters for the dashboard's hot
+# paths. Off unless DASHBOARD_METRICS is set (or a log/scrape file is given);
+# when off, decorators return the function untouched and spans are a shared
+# no-op context, so the instrumented code pays next to nothing.
+import json
+import logging
+import os
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager, nullcontext
+from functools import wraps
+
+# Structured JSON log: one line per page run
+METRICS_LOG = os.environ.get("DASHBOARD_METRICS_LOG")
+# Prometheus text-format file, rewritten after every page run for a scraper to read
+METRICS_PROM = os.environ.get("DASHBOARD_METRICS_PROM")
+ENABLED = (os.environ.get("DASHBOARD_METRICS", "").lower() not in ("", "0", "false", "no")
+           or bool(METRICS_LOG or METRICS_PROM))
+
+_NOOP_SPAN = nullcontext()
+_PAGE_SIZE = os.sysconf('SC_PAGE_SIZE') if hasattr(os, 'sysconf') else 4096
+
+# Resident set size right now (not the peak); 0 where /proc is unavailable
+def current_rss():
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * _PAGE_SIZE
+    except (OSError, IndexError, ValueError):
+        return 0
+
+class MetricsRecorder:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.span_calls = defaultdict(int)
+        self.span_seconds = defaultdict(float)
+        self.span_max_seconds = defaultdict(float)
+        self.cache_lookups = defaultdict(int)
+        self.cache_misses = defaultdict(int)
+        self.runs = 0
+        self.first_paint_seconds = None
+        self.last_paint_seconds = None
+
+    # Spans are collected per thread, so concurrent sessions keep separate runs
+    def _stack(self):
+        if not hasattr(self._local, 'stack'):
+            self._local.stack = []
+            self._local.spans = None
+        return self._local.stack
+
+    @contextmanager
+    def span(self, name):
+        stack = self._stack()
+        record = {'name': name, 'parent': stack[-1]['name'] if stack else None, 'depth': len(stack)}
+        stack.append(record)
+        rss = current_rss()
+        started = record['started'] = time.perf_counter()
+        try:
+            yield record
+        finally:
+            seconds = time.perf_counter() - started
+            stack.pop()
+            record['seconds'] = round(seconds, 6)
+            record['rss_delta_bytes'] = current_rss() - rss
+            if self._local.spans is not None:
+                self._local.spans.append(record)
+            with self._lock:
+                self.span_calls[name] += 1
+                self.span_seconds[name] += seconds
+                self.span_max_seconds[name] = max(self.span_max_seconds[name], seconds)
+
+    def count_lookup(self, cache, miss=False):
+        with self._lock:
+            self.cache_lookups[cache] += 1
+            if miss:
+                self.cache_misses[cache] += 1
+
+    def count_miss(self, cache):
+        with self._lock:
+            self.cache_misses[cache] += 1
+
+    def start_run(self):
+        self._stack().clear()
+        self._local.spans = []
+        self._local.started = time.perf_counter()
+
+    # Close the thread's run and publish it; spans are listed in start order
+    def finish_run(self):
+        self._stack()
+        spans = self._local.spans
+        if spans is None:
+            return None
+        self._local.spans = None
+        run_started = self._local.started
+        spans = sorted(spans, key=lambda record: record['started'])
+        for record in spans:
+            record['started'] = round(record['started'] - run_started, 6)
+        with self._lock:
+            self.runs += 1
+            counters = self.cache_snapshot()
+        run = {'timestamp': time.time(), 'seconds': round(time.perf_counter() - run_started, 6),
+               'paint_seconds': self.last_paint_seconds, 'first_paint_seconds': self.first_paint_seconds,
+               'rss_bytes': current_rss(), 'spans': spans, 'caches': counters}
+        if METRICS_LOG:
+            self.write_log(run)
+        if METRICS_PROM:
+            self.write_prometheus()
+        return run
+
+    # Seconds from the start of a script run until its page was fully sent; the
+    # process's first run includes module imports and the initial data load
+    def record_paint(self, seconds):
+        with self._lock:
+            self.last_paint_seconds = round(seconds, 6)
+            if self.first_paint_seconds is not None:
+                return
+            self.first_paint_seconds = self.last_paint_seconds
+        logging.getLogger(__name__).info("Time to first paint: %.3fs", seconds)
+
+    def cache_snapshot(self):
+        return {cache: {'lookups': lookups, 'misses': self.cache_misses[cache],
+                        'hits': lookups - self.cache_misses[cache]}
+                for cache, lookups in sorted(self.cache_lookups.items())}
+
+    def write_log(self, run, path=None):
+        line = json.dumps(run, default=str)
+        with self._lock, open(path or METRICS_LOG, 'a', encoding='utf-8') as f:
+            f.write(line + '\n')
+
+    def prometheus_text(self):
+        lines = ['# HELP dashboard_span_seconds_total Time spent in each instrumented stage.',
+                 '# TYPE dashboard_span_seconds_total counter']
+        with self._lock:
+            spans = sorted(self.span_calls)
+            lines += [f'dashboard_span_seconds_total{{span="{_label(name)}"}} {self.span_seconds[name]:.6f}'
+                      for name in spans]
+            lines += ['# HELP dashboard_span_calls_total Times each instrumented stage ran.',
+                      '# TYPE dashboard_span_calls_total counter']
+            lines += [f'dashboard_span_calls_total{{span="{_label(name)}"}} {self.span_calls[name]}'
+                      for name in spans]
+            lines += ['# HELP dashboard_span_max_seconds Slowest single run of each stage.',
+                      '# TYPE dashboard_span_max_seconds gauge']
+            lines += [f'dashboard_span_max_seconds{{span="{_label(name)}"}} {self.span_max_seconds[name]:.6f}'
+                      for name in spans]
+            lines += ['# HELP dashboard_cache_lookups_total Lookups per cache.',
+                      '# TYPE dashboard_cache_lookups_total counter']
+            lines += [f'dashboard_cache_lookups_total{{cache="{_label(cache)}"}} {count}'
+                      for cache, count in sorted(self.cache_lookups.items())]
+            lines += ['# HELP dashboard_cache_misses_total Lookups that had to compute or load.',
+                      '# TYPE dashboard_cache_misses_total counter']
+            lines += [f'dashboard_cache_misses_total{{cache="{_label(cache)}"}} {self.cache_misses[cache]}'
+                      for cache in sorted(self.cache_lookups)]
+            if self.first_paint_seconds is not None:
+                lines += ['# HELP dashboard_first_paint_seconds First page run after start, imports and data load included.',
+                          '# TYPE dashboard_first_paint_seconds gauge',
+                          f'dashboard_first_paint_seconds {self.first_paint_seconds:.6f}',
+                          '# HELP dashboard_last_paint_seconds Most recent page run.',
+                          '# TYPE dashboard_last_paint_seconds gauge',
+                          f'dashboard_last_paint_seconds {self.last_paint_seconds:.6f}']
+            lines += ['# HELP dashboard_page_runs_total Completed page runs.',
+                      '# TYPE dashboard_page_runs_total counter',
+                      f'dashboard_page_runs_total {self.runs}']
+        return '\n'.join(lines) + '\n'
+
+    def write_prometheus(self, path=None):
+        path = path or METRICS_PROM
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(self.prometheus_text())
+        os.replace(tmp_path, path)
+
+def _label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"')
+
+RECORDER = MetricsRecorder()
+
+def span(name):
+    if not ENABLED:
+        return _NOOP_SPAN
+    return RECORDER.span(name)
+
+# Wrap a function in a span named after it; a no-op decoration when disabled
+def timed(name=None):
+    def decorate(func):
+        if not ENABLED:
+            return func
+        label = name or func.__name__
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with RECORDER.span(label):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorate
+
+# Every lookup is counted; misses are counted where the value gets computed.
+# Hits are lookups minus misses.
+def cache_lookup(cache, miss=False):
+    if ENABLED:
+        RECORDER.count_lookup(cache, miss)
+
+def cache_miss(cache):
+    if ENABLED:
+        RECORDER.count_miss(cache)
+
+# Always recorded: a single call per page run, and startup regressions are the point
+def record_paint(seconds):
+    RECORDER.record_paint(seconds)
+
+def start_run():
+    if ENABLED:
+        RECORDER.start_run()
+
+def finish_run():
+    if ENABLED:
+        return RECORDER.finish_run()
+    return None
@@ -0,0 +1,144 @@
+# Headless batch reports: the dashboard's summary, top-attorney ranking and
+# leaver impact for many periods and partitions at once, without Streamlit.
+#
+#   python reports.py --period "Q4 2024" --period "Q1 2025" --partition-by Office --format csv xlsx json
+import argparse
+import json
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import pandas as pd
+
+from analytics import (
+    DASHBOARD_COLUMNS, PandasInvoiceEngine, build_originator_index, compact_invoice_frame,
+    create_personnel_summary, leaver_impact, load_invoice_cube, personnel_impact,
+    query_personnel_changes, quarter_bounds, read_invoice_data, top_attorneys,
+)
+
+REPORT_FORMATS = ('csv', 'xlsx', 'json')
+REPORT_METRIC = 'Invoice_Total_in_USD'
+ALL_PERIODS = 'All'
+
+# Set once per worker by _init_worker. With the fork start method the frame is
+# inherited from the parent rather than copied through a pipe.
+_WORKER = {}
+
+def _init_worker(invoices, cube, personnel):
+    _WORKER['invoices'] = invoices
+    _WORKER['cube'] = cube
+    _WORKER['personnel'] = personnel
+    _WORKER['originator_index'] = build_originator_index(cube.index.get_level_values('Originator'))
+
+def _slug(value):
+    return re.sub(r'[^A-Za-z0-9]+', '-', str(value)).strip('-').lower() or 'blank'
+
+# Every quarter on record, oldest first
+def personnel_periods(personnel):
+    return personnel.groupby('quarter')['date'].min().sort_values().index.tolist()
+
+# The three report tables for one period of one partition
+def build_report(invoices, cube, personnel, originator_index, period, top_n=10):
+    engine = PandasInvoiceEngine(invoices, cube)
+    start = end = None
+    if period != ALL_PERIODS:
+        start, end = quarter_bounds(period)
+        personnel = personnel[personnel['quarter'] == period]
+    totals = engine.originator_totals(REPORT_METRIC, start, end)
+    impact_df = personnel_impact(personnel, totals, originator_index)
+    leavers = leaver_impact(impact_df)
+    return {
+        'summary': create_personnel_summary(personnel),
+        'top_attorneys': top_attorneys(engine, REPORT_METRIC, top_n, start, end),
+        'leaver_impact': leavers[['Attorney', 'date', 'Originator', 'Total_Billed']],
+    }
+
+def write_report(tables, directory, formats):
+    os.makedirs(directory, exist_ok=True)
+    written = []
+    if 'csv' in formats:
+        for name, table in tables.items():
+            path = os.path.join(directory, f"{name}.csv")
+            table.to_csv(path, index=False)
+            written.append(path)
+    if 'xlsx' in formats:
+        path = os.path.join(directory, "report.xlsx")
+        with pd.ExcelWriter(path, engine='xlsxwriter', datetime_format='mm/dd/yyyy') as writer:
+            for name, table in tables.items():
+                table.to_excel(writer, sheet_name=name.replace('_', ' ').title(), index=False)
+        written.append(path)
+    if 'json' in formats:
+        path = os.path.join(directory, "report.json")
+        payload = {name: json.loads(table.to_json(orient='records', date_format='iso'))
+                   for name, table in tables.items()}
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(payload, f, indent=2)
+        written.append(path)
+    return written
+
+# One unit of pool work: a period within a partition (None is the whole firm)
+def _run_task(task):
+    period, partition_by, partition, directory, formats, top_n = task
+    invoices, cube = _WORKER['invoices'], _WORKER['cube']
+    if partition is not None:
+        invoices = invoices[invoices[partition_by] == partition]
+        # The shared cube covers every partition, so the partition builds its own
+        cube = None
+    tables = build_report(invoices, cube, _WORKER['personnel'], _WORKER['originator_index'], period, top_n)
+    return write_report(tables, directory, formats)
+
+def plan_tasks(periods, partition_by, partitions, output_dir, formats, top_n):
+    tasks = []
+    for partition in partitions:
+        partition_dir = 'all' if partition is None else f"{_slug(partition_by)}-{_slug(partition)}"
+        for period in periods:
+            directory = os.path.join(output_dir, _slug(period), partition_dir)
+            tasks.append((period, partition_by, partition, directory, formats, top_n))
+    return tasks
+
+def run_reports(periods=None, partition_by=None, output_dir='reports', formats=REPORT_FORMATS,
+                top_n=10, workers=None, source=None):
+    # Load and compact the invoices once; every worker reads this same frame
+    columns = DASHBOARD_COLUMNS + ([partition_by] if partition_by else [])
+    invoices = compact_invoice_frame(read_invoice_data(columns, source))
+    if partition_by is not None and partition_by not in invoices.columns:
+        raise ValueError(f"Invoice data has no column named {partition_by!r}")
+    cube = PandasInvoiceEngine(invoices, load_invoice_cube(source)).cube
+    personnel = query_personnel_changes()
+    periods = periods or personnel_periods(personnel) + [ALL_PERIODS]
+    partitions = [None]
+    if partition_by is not None:
+        partitions += sorted(invoices[partition_by].dropna().unique())
+    tasks = plan_tasks(periods, partition_by, partitions, output_dir, formats, top_n)
+    written = []
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(invoices, cube, personnel)) as pool:
+        futures = [pool.submit(_run_task, task) for task in tasks]
+        for future in as_completed(futures):
+            written.extend(future.result())
+    return sorted(written)
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Write personnel and billing reports without the dashboard.")
+    parser.add_argument('--period', action='append', dest='periods', metavar='QUARTER',
+                        help=f'quarter label such as "Q4 2024" or "{ALL_PERIODS}"; repeatable '
+                             '(default: every quarter on record plus all time)')
+    parser.add_argument('--partition-by', metavar='COLUMN',
+                        help="invoice column to split reports by, e.g. Office")
+    parser.add_argument('--format', nargs='+', dest='formats', choices=REPORT_FORMATS,
+                        default=list(REPORT_FORMATS))
+    parser.add_argument('--output-dir', default='reports')
+    parser.add_argument('--top', type=int, default=10, dest='top_n', help="attorneys in the billing ranking")
+    parser.add_argument('--workers', type=int, help="worker processes (default: one per CPU)")
+    parser.add_argument('--source', help="invoice CSV or directory of extracts")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    written = run_reports(args.periods, args.partition_by, args.output_dir, args.formats,
+                          args.top_n, args.workers, args.source)
+    for path in written:
+        print(path)
+
+if __name__ == "__main__":
+    main()
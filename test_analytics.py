@@ -0,0 +1,115 @@
+# Value-level checks for the invoice parsers and the Arrow ingest.
+#
+#   python -m pytest -q
+import threading
+
+import pandas as pd
+import pytest
+
+import analytics
+from analytics import USD_FORMAT, parse_dates, parse_money
+
+def money(*values):
+    amounts, failed = parse_money(pd.Series(values, dtype=object), USD_FORMAT)
+    return amounts.tolist(), failed
+
+@pytest.mark.parametrize('text, expected', [
+    ("$1,234.50", 1234.50),
+    ("1234.50", 1234.50),
+    ("-1,234.50", -1234.50),
+    ("(1,234.50)", -1234.50),
+    ("$(5.00)", -5.00),
+    ("($5.00)", -5.00),
+    (" $ 3 ", 3.0),
+    ("-", 0.0),
+    ("", 0.0),
+])
+def test_parse_money_values(text, expected):
+    assert money(text) == ([expected], 0)
+
+def test_parse_money_blank_and_junk():
+    assert money(None, "n/a") == ([0.0, 0.0], 1)
+
+def test_parse_money_whole_dollars_stay_float():
+    amounts, _ = parse_money(pd.Series(["$1,000", "(5)", "-", ""]), USD_FORMAT)
+    assert amounts.dtype == 'float64'
+    assert amounts.tolist() == [1000.0, -5.0, 0.0, 0.0]
+
+def test_parse_money_empty_chunk_is_float():
+    amounts, failed = parse_money(pd.Series([], dtype=object), USD_FORMAT)
+    assert amounts.dtype == 'float64' and failed == 0
+
+def test_parse_dates_falls_back_per_value():
+    parsed, failed = parse_dates(pd.Series(["2024-01-31", "02/15/2024", "soon", None]), ['%Y-%m-%d', '%m/%d/%Y'])
+    assert parsed.tolist()[:2] == [pd.Timestamp('2024-01-31'), pd.Timestamp('2024-02-15')]
+    assert parsed.isna().tolist()[2:] == [True, True]
+    assert failed == 1
+
+@pytest.fixture
+def workdir(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
+
+def write_extract(path, totals, matters=None):
+    frame = pd.DataFrame({'Originator': ['Jane Doe', 'John Roe'] * (len(totals) // 2),
+                          'Invoice_Date': '2024-03-01', 'Invoice_Total_in_USD': totals})
+    if matters is not None:
+        frame['Matter'] = matters
+    frame.to_csv(path, index=False)
+
+# The first chunk is all whole dollars; a later one has cents
+@pytest.mark.skipif(analytics.pa is None, reason="needs pyarrow")
+def test_ingest_mixed_chunks(workdir):
+    write_extract('invoices.csv', ["$1,000", "(5)", "$12.50", "-"])
+    analytics.refresh_invoice_cache('invoices.csv', chunk_rows=2)
+    df = analytics.read_invoice_data(source='invoices.csv')
+    assert df['Invoice_Total_in_USD'].tolist() == [1000.0, -5.0, 12.5, 0.0]
+    cube = analytics.load_invoice_cube('invoices.csv')
+    assert cube['Invoice_Total_in_USD'].groupby(level='Originator').sum().to_dict() == {
+        'Jane Doe': 1012.5, 'John Roe': -5.0}
+
+@pytest.mark.skipif(analytics.pa is None, reason="needs pyarrow")
+def test_ingest_small_chunks_and_header_only_extract(workdir):
+    (workdir / 'extracts').mkdir()
+    write_extract('extracts/a.csv', ["$1,000", "(5)", "$12.50", "-"])
+    pd.DataFrame(columns=['Originator', 'Invoice_Date', 'Invoice_Total_in_USD']).to_csv('extracts/b.csv', index=False)
+    analytics.refresh_invoice_cache('extracts', chunk_rows=2)
+    df = analytics.read_invoice_data(source='extracts')
+    assert df['Invoice_Total_in_USD'].tolist() == [1000.0, -5.0, 12.5, 0.0]
+
+# A column outside the schema that turns non-numeric late in the file
+@pytest.mark.skipif(analytics.pa is None, reason="needs pyarrow")
+def test_ingest_late_text_in_numeric_looking_column(workdir):
+    rows = 12000
+    matters = [str(i) for i in range(rows)]
+    matters[-1] = "M-100"
+    write_extract('invoices.csv', ["$1.00"] * rows, matters)
+    df = analytics.read_invoice_data(source='invoices.csv')
+    assert len(df) == rows and df['Matter'].iloc[-1] == "M-100"
+
+# Integer dollars are not cents: only compaction's own columns are divided by 100
+def test_integer_dollars_are_not_cents():
+    raw = pd.DataFrame({'Originator': ['Jane Doe', 'John Roe'], 'Invoice_Date': pd.to_datetime(['2024-03-01'] * 2),
+                        'Invoice_Total_in_USD': pd.Series([1000, 2500], dtype='int64'),
+                        'Invoice_Balance_Due_in_USD': pd.Series([100, 0], dtype='int64')})
+    for df in (raw, analytics.compact_invoice_frame(raw)):
+        totals = analytics.PandasInvoiceEngine(df).originator_totals('Invoice_Total_in_USD')
+        assert totals.to_dict() == {'Jane Doe': 1000.0, 'John Roe': 2500.0}
+        assert analytics.InvoiceFilterIndex(df).balance_range == (0, 100)
+    compact = analytics.compact_invoice_frame(raw)
+    assert analytics.money_values(compact, 'Invoice_Total_in_USD').tolist() == [1000.0, 2500.0]
+
+# Concurrent first connections (one per session thread) seed the registry once
+def test_personnel_registry_seeded_once(tmp_path):
+    path = str(tmp_path / 'personnel.db')
+    barrier = threading.Barrier(8)
+
+    def connect():
+        barrier.wait()
+        analytics.connect_personnel_registry(path).close()
+    threads = [threading.Thread(target=connect) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert analytics.count_personnel_changes(path=path) == len(analytics.SEED_PERSONNEL_CHANGES)